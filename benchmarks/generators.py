@@ -0,0 +1,290 @@
+"""Seeded synthetic exports for every importer format.
+
+Each generator writes a CSV with the given number of rows and the mapping
+files its importer reads into data_dir/mappings. The same seed always
+produces the same files.
+"""
+import csv
+import os
+import random
+from datetime import date, timedelta
+
+START = date(2015, 7, 1)
+DAYS = 365 * 8
+
+# Amounts repeat a lot in real exports, mix a few fixed ones with random ones
+COMMON_AMOUNTS = ['-4.50', '-12.00', '-5.00', '-20.00', '-87.95', '100.00']
+
+
+def _date(rng):
+    return START + timedelta(days=rng.randrange(DAYS))
+
+
+def _amount(rng, low, high):
+    if rng.random() < 0.4:
+        return rng.choice(COMMON_AMOUNTS)
+    return '{:.2f}'.format(rng.uniform(low, high))
+
+
+def _negate(text):
+    return text[1:] if text.startswith('-') else '-' + text
+
+
+def _mappings_dir(data_dir):
+    path = os.path.join(data_dir, 'mappings')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+#
+# ACTUAL BUDGET
+#
+
+ACTUAL_ACCOUNTS = {
+    'Everyday': 'Assets:Bank:Everyday',
+    'Savings': 'Assets:Bank:Savings',
+    'Credit Card': 'Liabilities:CreditCard',
+    'Home Loan': 'Liabilities:HomeLoan',
+    'Brokerage': 'Assets:Brokerage',
+}
+ACTUAL_OFF_BUDGET = ('Brokerage',)
+ACTUAL_CATEGORIES = {
+    'Groceries': 'Expenses:Food:Groceries',
+    'Dining': 'Expenses:Food:Dining',
+    'Fuel': 'Expenses:Transport:Fuel',
+    'Utilities': 'Expenses:Home:Utilities',
+    'Salary': 'Income:Salary',
+    'No Category': 'Expenses:Uncategorised',
+    'Bank Loan Interest': 'Expenses:Interest:HomeLoan',
+}
+ACTUAL_PAYEES = ['Woolworths', 'Coles', 'Shell', 'Origin Energy', 'Employer', 'Cafe', 'Aldi']
+
+
+def actual_mappings(data_dir):
+    path = os.path.join(_mappings_dir(data_dir), 'actual_budget_mappings.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Budget Account', 'Ledger Account', 'Off-Budget'])
+        for name, account in ACTUAL_ACCOUNTS.items():
+            writer.writerow([name, account, 'Y' if name in ACTUAL_OFF_BUDGET else 'N'])
+        for name, account in ACTUAL_CATEGORIES.items():
+            writer.writerow([name, account, ''])
+    return path
+
+
+def actual(path, rows, seed=0):
+    # Regular spending, splits, both legs of transfers, loan interest, off-budget
+    # accounts, #tags, starting balances and uncleared or zero rows
+    rng = random.Random(seed)
+    accounts = list(ACTUAL_ACCOUNTS)
+    categories = [name for name in ACTUAL_CATEGORIES if name not in ('No Category', 'Bank Loan Interest')]
+    cleared = ['Cleared', 'Reconciled', 'Reconciled', 'Not cleared']
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Account', 'Date', 'Payee', 'Notes', 'Category', 'Amount', 'Cleared'])
+        written = 0
+        while written < rows:
+            day = _date(rng).isoformat()
+            account = rng.choice(accounts)
+            status = rng.choice(cleared)
+            kind = rng.random()
+
+            if kind < 0.15:
+                # Transfer, usually with the other leg in the same export
+                other = rng.choice([name for name in accounts if name != account])
+                value = _amount(rng, -500, 500)
+                writer.writerow([account, day, other, '', '', value, status])
+                written += 1
+                if rng.random() < 0.8 and written < rows:
+                    writer.writerow([other, day, account, '', '', _negate(value), status])
+                    written += 1
+            elif kind < 0.25:
+                # Split transaction
+                parts = rng.randint(2, 4)
+                payee = rng.choice(ACTUAL_PAYEES)
+                for part in range(1, parts + 1):
+                    notes = 'Weekly shop (SPLIT {} OF {}) #Household #Trip'.format(part, parts)
+                    writer.writerow([account, day, payee, notes, rng.choice(categories),
+                                     _amount(rng, -80, -1), status])
+                    written += 1
+            elif kind < 0.28:
+                writer.writerow(['Home Loan', day, 'Bank', 'Interest on Loan', '',
+                                 _amount(rng, -900, -300), status])
+                written += 1
+            elif kind < 0.29:
+                writer.writerow([account, day, 'Starting Balance', '', '', _amount(rng, 0, 5000), status])
+                written += 1
+            else:
+                notes = rng.choice(['', '', 'Groceries', '#Holiday', 'Dinner #Birthday #Family'])
+                category = rng.choice(categories + [''])
+                value = '0.00' if rng.random() < 0.01 else _amount(rng, -200, 200)
+                writer.writerow([account, day, rng.choice(ACTUAL_PAYEES), notes, category, value, status])
+                written += 1
+    return path
+
+
+#
+# IOOF SUPER
+#
+
+IOOF_OPTIONS = {
+    'IOOF Balanced': 'IOOFBAL',
+    'IOOF Growth': 'IOOFGRO',
+    'IOOF Cash': 'IOOFCSH',
+}
+
+
+def ioof_mappings(data_dir):
+    path = os.path.join(_mappings_dir(data_dir), 'ioof_transactions_mappings.csv')
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['trans_type', 'account_1', 'account_1_value', 'account_2',
+                         'account_2_value', 'asset_name_2', 'asset_code_2'])
+        writer.writerow(['Employer Contribution', 'Assets:Super:Cash', '1', 'Income:Super:Contributions', '-1', '', ''])
+        writer.writerow(['Administration Fee', 'Assets:Super:Cash', '-1', 'Expenses:Super:Fees', '1', '', ''])
+        writer.writerow(['Contributions Tax', 'Assets:Super:Cash', '-1', 'Expenses:Super:Tax', '1', '', ''])
+        for name, code in IOOF_OPTIONS.items():
+            account = 'Assets:Super:' + code
+            writer.writerow([name, 'Assets:Super:Cash', '-1', account, '1', name, code])
+    return path
+
+
+def ioof(path, rows, seed=0):
+    # Mostly unit buys and sells across the investment options, plus cash flows
+    rng = random.Random(seed)
+    options = list(IOOF_OPTIONS)
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date', 'Type', 'Description', 'Unit price', 'Units', 'Amount'])
+        for _ in range(rows):
+            day = _date(rng).strftime('%d/%m/%Y')
+            kind = rng.random()
+            if kind < 0.7:
+                trans_type = 'Buys' if kind < 0.5 else 'Sells'
+                description = rng.choice(options)
+                price = rng.uniform(1, 3)
+                units = rng.uniform(1, 400)
+                writer.writerow([day, trans_type, description, '{:.4f}'.format(price),
+                                 '{:.4f}'.format(units), '{:.2f}'.format(price * units)])
+            else:
+                trans_type = rng.choice(['Employer Contribution', 'Administration Fee', 'Contributions Tax'])
+                writer.writerow([day, trans_type, trans_type, '', '', _amount(rng, 1, 1500).lstrip('-')])
+    return path
+
+
+#
+# COINSPOT
+#
+
+COINS = ['BTC', 'ETH', 'ADA', 'SOL', 'DOT']
+
+
+def coinspot(path, rows, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Transaction Date', 'Type', 'Market', 'Amount', 'Rate inc. fee', 'Rate ex. fee',
+                         'Fee', 'Fee AUD (inc GST)', 'GST AUD', 'Total AUD', 'Total (inc GST)'])
+        for _ in range(rows):
+            day = _date(rng)
+            coin = rng.choice(COINS)
+            units = rng.uniform(0.001, 2)
+            rate = rng.uniform(1, 60000)
+            fee = rate * units * 0.01
+            writer.writerow([
+                '{}/{}/{}'.format(day.day, day.month, day.year),
+                'Buy' if rng.random() < 0.75 else 'Sell',
+                coin + '/AUD',
+                '{:.8f}'.format(units),
+                '{:.2f}'.format(rate),
+                '{:.2f}'.format(rate * 0.99),
+                '{:.2f}'.format(fee),
+                '{:.2f}'.format(fee),
+                '{:.2f}'.format(fee / 11),
+                '{:.2f}'.format(rate * units),
+                '{:.2f} AUD'.format(rate * units),
+            ])
+    return path
+
+
+#
+# CRYPTO TAX
+#
+
+def crypto(path, rows, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        f.write('Id,Wallet,Transaction Date,Type,Subtype,Asset,Amount,Costbase,Remarks,Txid,Realised.TAX_GAIN\n')
+        writer = csv.writer(f)
+        for index in range(rows):
+            kind = rng.choice(['Buy', 'Buy', 'Sell', 'Earn', 'Transfer'])
+            units = rng.uniform(0.001, 2)
+            if kind in ('Sell', 'Transfer'):
+                units = -units
+            asset = rng.choice(COINS)
+            if rng.random() < 0.1:
+                asset += '#2'
+            writer.writerow([
+                index,
+                rng.choice(['CoinSpot', 'Ledger', 'Binance']),
+                _date(rng).strftime('%d/%m/%Y'),
+                kind,
+                'Staking' if kind == 'Earn' else '',
+                asset,
+                '{:.8f}'.format(units),
+                '{:.2f}'.format(rng.uniform(1, 5000)),
+                '',
+                '0x{:016x}'.format(rng.getrandbits(64)),
+                '{:.2f}'.format(rng.uniform(-300, 300)) if kind == 'Sell' else '0',
+            ])
+    return path
+
+
+#
+# CUSTOM CSV
+#
+
+def custom_csv(path, rows, seed=0):
+    # Multi-leg manual entries, the last leg is left blank and balanced by the importer
+    rng = random.Random(seed)
+    accounts = ['Assets:Bank:Everyday', 'Expenses:Home', 'Expenses:Food', 'Expenses:Gifts', 'Income:Other']
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date', 'Flag', 'Payee', 'Description', 'Tags',
+                         'Account1', 'Amount1', 'Account2', 'Amount2',
+                         'Account3', 'Amount3', 'Account4', 'Amount4'])
+        for _ in range(rows):
+            day = _date(rng)
+            legs = rng.sample(accounts, rng.randint(2, 3))
+            record = [
+                '{}/{}/{}'.format(day.day, day.month, day.year),
+                rng.choice(['', '', '!']),
+                rng.choice(ACTUAL_PAYEES),
+                'Manual adjustment',
+                rng.choice(['', 'Adjustment', 'Adjustment,Review']),
+            ]
+            for account in legs[:-1]:
+                record += [account, _amount(rng, -300, 300)]
+            record += [legs[-1], '']
+            record += [''] * (13 - len(record))
+            writer.writerow(record)
+    return path
+
+
+# name -> (file name, generator, mapping writer)
+FORMATS = {
+    'actual_budget': ('actual_export.csv', actual, actual_mappings),
+    'ioof_super': ('ioof_transactions.csv', ioof, ioof_mappings),
+    'coinspot': ('coinspot_orders.csv', coinspot, None),
+    'crypto': ('crypto_tax.csv', crypto, None),
+    'custom_csv': ('c_adjustments.csv', custom_csv, None),
+}
+
+
+def generate(name, data_dir, rows, seed=0):
+    # Write the export and its mapping files, returning the export path
+    filename, generator, mappings = FORMATS[name]
+    if mappings is not None:
+        mappings(data_dir)
+    return generator(os.path.join(data_dir, filename), rows, seed)
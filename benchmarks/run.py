@@ -0,0 +1,169 @@
+"""Time identify() and extract() for every importer on synthetic exports.
+
+    python -m benchmarks.run                        # 1k and 10k rows, compared to the baselines
+    python -m benchmarks.run --rows 1000 1000000    # other sizes
+    python -m benchmarks.run --only actual_budget   # a single importer
+    python -m benchmarks.run --save                 # store the results as the new baselines
+
+Exits with status 1 when an importer is slower or uses more memory than
+its stored baseline by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from . import generators
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+DEFAULT_ROWS = (1000, 10000)
+
+# Differences smaller than this are timer noise and never count as a regression
+MIN_SECONDS = 0.005
+MIN_KIB = 256
+
+
+def importers():
+    # Imported after LEDGER_DATA_DIR points at the generated mapping files
+    from beancount.ingest import cache
+
+    from importers import actual_budget, ioof_super
+    from importers.coinspot import CoinSpotImporter
+    from importers.crypto import CryptoImporter
+    from importers.custom_csv import CSVImporter
+
+    # name -> (importer, converts a path to the argument the importer expects, extract arguments)
+    path = lambda filepath: filepath
+    memo = cache.get_file
+    return {
+        'actual_budget': (actual_budget.Importer('Assets:Bank:Everyday'), path, ([],)),
+        'ioof_super': (ioof_super.Importer('Assets:Super'), path, ([],)),
+        'coinspot': (CoinSpotImporter(), memo, ()),
+        'crypto': (CryptoImporter(), memo, ()),
+        'custom_csv': (CSVImporter(), memo, ()),
+    }
+
+
+def clear_caches():
+    from importers import extract_cache, mappings, registry
+    mappings.clear()
+    registry.clear()
+    # Time the importers themselves even when IMPORTER_CACHE is set
+    extract_cache.disable()
+
+
+def measure(importer, arg, extra, repeat):
+    # Best of repeat runs with cold caches, then one traced run for peak memory
+    identify = extract = float('inf')
+    entries = 0
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        if not importer.identify(arg):
+            raise RuntimeError('{} did not identify its own file'.format(type(importer).__name__))
+        identify = min(identify, time.perf_counter() - start)
+
+        clear_caches()
+        start = time.perf_counter()
+        entries = len(importer.extract(arg, *extra))
+        extract = min(extract, time.perf_counter() - start)
+
+    clear_caches()
+    tracemalloc.start()
+    importer.extract(arg, *extra)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'entries': entries,
+        'identify': round(identify, 6),
+        'extract': round(extract, 6),
+        'peak_kib': peak // 1024,
+    }
+
+
+def regressions(name, rows, result, baseline, tolerance):
+    found = []
+    for key, floor in (('identify', MIN_SECONDS), ('extract', MIN_SECONDS), ('peak_kib', MIN_KIB)):
+        old, new = baseline.get(key), result[key]
+        if old is None:
+            continue
+        if new > old * (1 + tolerance) and new - old > floor:
+            found.append('{} {} rows: {} {} -> {}'.format(name, rows, key, old, new))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--only', nargs='+', choices=sorted(generators.FORMATS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown as a fraction of the baseline (default 0.5).')
+    parser.add_argument('--save', action='store_true', help='Store the results as the new baselines.')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    cwd = os.getcwd()
+    ledger_data_dir = os.environ.get('LEDGER_DATA_DIR')
+    with tempfile.TemporaryDirectory(prefix='beancount_importers_bench_') as data_dir:
+        os.environ['LEDGER_DATA_DIR'] = data_dir
+        # Mapping files are looked up in the working directory first
+        os.chdir(data_dir)
+        try:
+            return run(args, data_dir)
+        finally:
+            os.chdir(cwd)
+            if ledger_data_dir is None:
+                del os.environ['LEDGER_DATA_DIR']
+            else:
+                os.environ['LEDGER_DATA_DIR'] = ledger_data_dir
+
+
+def run(args, data_dir):
+    cases = importers()
+    names = args.only or list(generators.FORMATS)
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+
+    print('{:<15} {:>9} {:>9} {:>11} {:>11} {:>10}'.format(
+        'importer', 'rows', 'entries', 'identify s', 'extract s', 'peak KiB'))
+    found = []
+    for name in names:
+        importer, convert, extra = cases[name]
+        for rows in args.rows:
+            filepath = generators.generate(name, data_dir, rows, args.seed)
+            result = measure(importer, convert(filepath), extra, args.repeat)
+            os.remove(filepath)
+
+            print('{:<15} {:>9} {:>9} {:>11.4f} {:>11.4f} {:>10}'.format(
+                name, rows, result['entries'], result['identify'], result['extract'], result['peak_kib']))
+
+            baseline = baselines.get(name, {}).get(str(rows))
+            if baseline is not None:
+                found += regressions(name, rows, result, baseline, args.tolerance)
+            if args.save:
+                baselines.setdefault(name, {})[str(rows)] = result
+
+    if args.save:
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Saved baselines to {}'.format(BASELINES))
+    elif found:
+        print('\nRegressions:')
+        for line in found:
+            print('  ' + line)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
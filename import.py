@@ -3,16 +3,27 @@ import os, sys
 # beancount doesn't run from this directory
 sys.path.append(os.path.dirname(__file__))
 
-from importers import actual_budget
-from importers import ioof_super
+from importers import registry
+from importers.lazy import LazyImporter
 
 import beangulp
 
+# Importer modules are only imported when a file matches their header, see importers/lazy.py
+# The Actual Budget entry also reads Actual's db.sqlite
 CONFIG = [
-    actual_budget.Importer("Assets:Account"),
-    ioof_super.Importer("Assets:Account2")
+    LazyImporter("importers.actual_budget.Importer", ["Assets:Account"], signature=registry.ACTUAL_BUDGET,
+                 database=True),
+    LazyImporter("importers.ioof_super.Importer", ["Assets:Account2"], signature=registry.IOOF_SUPER),
 ]
 
 if __name__ == '__main__':
+    # The commands are only needed when run from the command line, fava just loads CONFIG
+    from importers import parallel
+    from importers import streaming
+
     ingest = beangulp.Ingest(CONFIG)
-    ingest()
\ No newline at end of file
+    # Replace beangulp's extract command with one that accepts --jobs N
+    ingest.cli.add_command(parallel.extract_command)
+    # Constant memory extraction of a single large file
+    ingest.cli.add_command(streaming.stream_command)
+    ingest()
@@ -6,46 +6,53 @@ from beancount.core import flags
 from beancount.core import data
 
 import beangulp
-from beangulp import mimetypes
-from beangulp.testing import main
 
-import csv
 from os import path, environ
-import re
 
 from datetime import datetime
-from itertools import chain, groupby
-from operator import itemgetter
+from itertools import chain
+
+from . import actual_clean
+from . import actual_db
+from . import checkpoints
+from . import dedup
+from . import extract_cache
+from . import mappings
+from . import registry
+from . import stats
+from . import transfers
+from .amounts import AmountCache
+from .actual_rows import read_rows, rows_from_records, group_rows
+from .dates import DateParser
 
 CSV_HEADER = "Account,Date,Payee,Notes,Category,Amount,Cleared"
 LEDGER_DATA_DIR = environ.get('LEDGER_DATA_DIR', '/Ledger')
 BEAN_DATA_DIR = path.join(LEDGER_DATA_DIR, "mappings")
 ACCOUNT_MAP = "actual_budget_mappings.csv"
+CHECKPOINTS = path.join(LEDGER_DATA_DIR, "import_checkpoints.json")
 MAP_HEADER = "Budget Account,Ledger Account,Off-Budget"
 
-def parse_date(text):
-    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
-        try:
-            return datetime.strptime(text, fmt).date()
-        except ValueError:
-            pass
-    raise ValueError('no valid date format found')
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y')
 
 class Importer(beangulp.Importer):
-    def __init__(self, account, currency='AUD', file_encoding='utf-8'):
+    header_signature = registry.ACTUAL_BUDGET
+
+    def __init__(self, account, currency='AUD', file_encoding='utf-8', incremental=False, transfer_window=1):
         self.importer_account = account
         self.currency = currency
         self.file_encoding = file_encoding
+        # Only extract rows added since the last run, see importers/checkpoints.py
+        # Every extract advances the checkpoint, so use it from bean-extract rather than fava
+        self.incremental = incremental
+        # Transfer legs whose accounts point at each other are paired up to this many days apart
+        self.transfer_window = transfer_window
 
     def identify(self, filepath):
-        with open(filepath, encoding=self.file_encoding) as f:
-            header = f.readline().strip()
-        
-        headers = header.split(',')
-        csv_headers = CSV_HEADER.split(',')
-
+        # Actual's own db.sqlite, see importers/actual_db.py
+        if actual_db.is_database(filepath):
+            return True
         # return True is all csv_headers in file_headers
-        return all(h in headers for h in csv_headers)
+        return registry.matches(self.header_signature, filepath, self.file_encoding)
 
     # def filename(self, filepath):
     #     """Return the optional renamed account filename."""
@@ -59,19 +66,14 @@ class Importer(beangulp.Importer):
 
     def get_account_map(self):
         # Get account mapping for Budget accounts --> Ledger accounts
-        # CSV should contain three columns "Budget Account, Ledger Account, Off-Budget"
-        # 1nd Column (Budget Acount) will be the key
-        try:
-            found_csv = path.exists(ACCOUNT_MAP)
-            csv_path = BEAN_DATA_DIR + "/" if not found_csv else ""
-            with open(csv_path + "/" + ACCOUNT_MAP) as f:
-                header = f.readline().strip()
-                if re.match(header, MAP_HEADER):
-                    reader = csv.reader(f)
-                    account_map = {rows[0]: {'Ledger Account': rows[1], 'Off-Budget': rows[2]} for rows in reader}
-            return account_map
-        except:
-            return False
+        # The parsed table is cached and only reloaded when the mapping file changes
+        return mappings.load(ACCOUNT_MAP, BEAN_DATA_DIR, mappings.parse_account_map)
+
+    def get_account_tables(self):
+        # Get the account map compiled into the lookup tables used by extract
+        # Compiled once per version of the mapping file, see mappings.compile_account_map
+        tables = mappings.load(ACCOUNT_MAP, BEAN_DATA_DIR, mappings.parse_account_tables)
+        return tables or mappings.NO_ACCOUNT_TABLES
 
     def off_budget_accounts(self, account_map):
         if account_map:
@@ -85,8 +87,7 @@ class Importer(beangulp.Importer):
 
     def get_ledger_account(self, account_map, account):
         try:
-            account_map = self.get_account_map()
-            if account_map: 
+            if account_map:
                 return account_map[account]["Ledger Account"]
             return account
         except KeyError:
@@ -103,181 +104,223 @@ class Importer(beangulp.Importer):
         except KeyError:
             return False
 
-    def extract(self, filepath, existing):
-        # Store csv rows in dict
-        with open(filepath, mode='r') as f:
-            rows = [row for row in csv.DictReader(f)]
-
-        # Get account mappings
-        account_map = self.get_account_map()
-        off_budget_accounts = self.off_budget_accounts(account_map)
-
-        # Clean up data
-        for index, row in enumerate(rows):
-            # Change accounts based on account mapping details
-            row["Account"] = self.get_ledger_account(account_map, row["Account"])
-            row["Category"] = self.get_ledger_account(account_map, row["Category"])
-
-            # Create key with absolute values
-            row["Abs"] = abs(D(row["Amount"]))
-
-            # Create exclude key
-            row["Exclude"] = False
-
-            # Create is_transfer key
-            row["Transfer"] = False
-
-            # Parse notes for tags
-            parse_notes = row["Notes"].split("#", 1)
-            row["Notes"] = parse_notes[0].strip()
-            row["Tags"] = ""
-            if len(parse_notes) > 1:
-                tags = parse_notes[1]
-                row["Tags"] = tags.replace(" #", ", ").lower()
-                row["Tags"] = tuple(row["Tags"].split(", "))
-
-            row["Tags"] = ', '.join(row["Tags"])
-
-            # Remove (SPLIT x OF y) in notes
-            row["Notes"] = re.sub(r'\(SPLIT \d+ OF \d+\)', '', row["Notes"]).strip()
-
-            # If payee is a balance sheet account and there is no cateogry then assume it to be a transfer
-            if self.is_bs_account(account_map, row['Payee']) and not row['Category']:
-                if not row['Notes']:
-                    row['Transfer'] = True
-                    row["Payee"] = self.get_ledger_account(account_map, row["Payee"])
+    def checkpoint_key(self):
+        # One checkpoint per importer account as re-downloaded exports usually get a new name
+        return "{}:{}".format(self.name, self.importer_account)
 
-                if row['Notes']:
-                    row['Category'] = self.get_ledger_account(account_map, row["Payee"])
-                    row['Payee'] = ""
+    def database_key(self):
+        # The sync cursor of Actual's db.sqlite, kept apart from the CSV checkpoint
+        return "{}:{}:db".format(self.name, self.importer_account)
 
-            # If no category
-            if not row['Category'] and not row['Notes'] == "Interest on Loan":
-                row['Category'] = self.get_ledger_account(account_map, "No Category")
+    def deduplicate(self, entries, existing):
+        # Mark entries already in the ledger through a hash index instead of pairwise comparison
+        dedup.mark_duplicates(entries, existing)
 
-            if not row['Category'] and row['Notes'] == "Interest on Loan":
-                row['Category'] = self.get_ledger_account(account_map, "Bank Loan Interest")
-
-            # Exclude if Payee = Starting Balance or account is an Off-budget account
-            if row['Payee'] == "Starting Balance" or row["Account"] in off_budget_accounts:
-                row['Exclude'] = True
-
-            # # Exclude all but cleared transactions
-            # if row['Cleared'] == "Reconciled" or row['Cleared'] == "Not cleared":
-            #     row['Exclude'] = True
+    # Rows dated after today are excluded, so cached entries are only reused on the same day
+    # Incremental runs depend on the checkpoint and are never cached
+    @extract_cache.cached(lambda self: [(ACCOUNT_MAP, BEAN_DATA_DIR)], daily=True, skip=lambda self: self.incremental)
+    def extract(self, filepath, existing):
+        # Store csv rows as Row records
+        recorder = stats.recorder(self, filepath)
+        amounts = AmountCache()
+        database = actual_db.is_database(filepath)
+        if database:
+            # Read Actual's db.sqlite, incremental runs only read the days changed since the cursor
+            cursor = None
+            if self.incremental:
+                store = checkpoints.Store(CHECKPOINTS)
+                cursor = store.get(self.database_key())
+            rows, cursor = actual_db.read_rows(filepath, amounts, cursor, self.transfer_window,
+                                               datetime.today().date())
+        elif self.incremental:
+            # Skip the rows before the checkpoint if the file still starts with them
+            store = checkpoints.Store(CHECKPOINTS)
+            start, first_row = checkpoints.resume(filepath, store.get(self.checkpoint_key()))
+            header, records = checkpoints.read_records(filepath, self.file_encoding, start)
+            rows = rows_from_records(header, (record for record, end in records), amounts)
+        else:
+            with open(filepath, encoding=self.file_encoding, newline='') as f:
+                rows = read_rows(f, amounts)
+
+        # Detect the date format once for the file
+        parse_date = DateParser(DATE_FORMATS)
+        parse_date.detect(row.date for row in rows)
+
+        recorder.add('rows', len(rows))
+        recorder.lap('read')
 
-            # Exclude if not cleared
-            if row['Cleared'] == "Not cleared":
-                row['Exclude'] = True
+        # Get account mappings
+        tables = self.get_account_tables()
+        ledger = tables.ledger.get
+        recorder.lap('mappings')
 
-            # Exclude all if dated after today
-            if parse_date(row['Date']) > datetime.today().date():
-                row['Exclude'] = True
+        # Clean up data
+        today = datetime.today().date()
+        if actual_clean.enabled(rows):
+            # Large files are cleaned a column at a time with NumPy when it is installed
+            actual_clean.clean_rows(rows, tables, parse_date, today)
+        else:
+            for index, row in enumerate(rows):
+                # Change accounts based on account mapping details
+                row.account = ledger(row.account, row.account)
+                row.category = ledger(row.category, row.category)
+
+                # Parse notes for tags and remove (SPLIT x OF y) in notes
+                row.notes, row.tags = actual_clean.clean_notes(row.notes)
+
+                # If payee is a balance sheet account and there is no cateogry then assume it to be a transfer
+                if row.payee in tables.balance_sheet and not row.category:
+                    if not row.notes:
+                        row.transfer = True
+                        row.payee = ledger(row.payee, row.payee)
+
+                    if row.notes:
+                        row.category = ledger(row.payee, row.payee)
+                        row.payee = ""
+
+                # If no category
+                if not row.category:
+                    row.category = tables.loan_interest if row.notes == "Interest on Loan" else tables.no_category
+
+                # Exclude if Payee = Starting Balance or account is an Off-budget account
+                if row.payee == "Starting Balance":
+                    row.exclude = "starting balance"
+                elif row.account in tables.off_budget:
+                    row.exclude = "off-budget"
+
+                # # Exclude all but cleared transactions
+                # if row.cleared == "Reconciled" or row.cleared == "Not cleared":
+                #     row.exclude = True
+
+                # Exclude if not cleared
+                if row.cleared == "Not cleared":
+                    row.exclude = "not cleared"
+
+                # Exclude all if dated after today
+                if parse_date(row.date) > today:
+                    row.exclude = "future date"
+
+                # Exclude if Abs = 0
+                if row.abs == 0:
+                    row.exclude = "zero amount"
+
+        if recorder.enabled:
+            # Exclude holds the reason of the last rule that excluded the row
+            for row in rows:
+                if row.exclude:
+                    recorder.add('excluded: ' + row.exclude)
+        recorder.lap('clean')
 
-            # Exclude if Abs = 0
-            if row['Abs'] == 0:
-                row['Exclude'] = True
+        # Group rows for postings if the specified columns match
+        trans_list, _ = group_rows([row for row in rows if not row.transfer])
+        # Pair the legs of transfers, see importers/transfers.py
+        tfr_list = transfers.match([row for row in rows if row.transfer and not row.exclude],
+                                   parse_date, self.transfer_window)
+        if self.incremental and not database:
+            # Rows dated after today are read again once their day has come
+            future = next((index for index, row in enumerate(rows) if parse_date(row.date) > today), None)
+            # Hold the unpaired legs the next run reads again, their partner may still be appended
+            reread = transfers.reread_from(rows, tfr_list, parse_date, self.transfer_window, future)
+            held = {id(row) for row in rows[reread:]}
+            tfr_list = [(key, values) for key, values in tfr_list if len(values) > 1 or id(values[0]) not in held]
+        recorder.add('groups', len(trans_list) + len(tfr_list))
+        if recorder.enabled:
+            recorder.add('unpaired transfer legs', sum(1 for key, values in tfr_list if len(values) == 1))
+        recorder.lap('group')
 
         #
         # NON-TRANSFERS
         #
 
-        # Group rows for postings if the specified columns match
-        trans_grouper = itemgetter("Date", "Transfer", "Account", "Payee", "Notes", "Tags", "Exclude")
-        trans_sort = sorted(rows, key = trans_grouper)
-        trans_list = [
-            {key: list(values)} 
-            for key, values in groupby(trans_sort, key = trans_grouper) 
-            if not key[1] and not key[6]
-            ]
-
         # Create entries
         # Create transaction entries
         entries = []
-        for dict in trans_list:
-            for index, (key, values) in enumerate(dict.items()):
-                parsed_date = parse_date(key[0])
-                trans_payee = key[3]
-                trans_narration = key[4]
-                trans_tags = key[5]
-
-                meta = data.new_metadata(f.name, index)
-
-                txn = data.Transaction(
-                    meta=meta,
-                    date=parsed_date,
-                    flag=flags.FLAG_OKAY,
-                    payee=trans_payee,
-                    narration=trans_narration,
-                    tags=set(filter(None, trans_tags.split(", "))),
-                    links=set(),
-                    postings=[],
+        for key, values in trans_list:
+            parsed_date = parse_date(key[0])
+            trans_payee = key[2]
+            trans_narration = key[3]
+            trans_tags = key[4]
+
+            meta = data.new_metadata(filepath, 0)
+
+            txn = data.Transaction(
+                meta=meta,
+                date=parsed_date,
+                flag=flags.FLAG_OKAY,
+                payee=trans_payee,
+                narration=trans_narration,
+                tags=set(filter(None, trans_tags.split(", "))),
+                links=set(),
+                postings=[],
+            )
+
+            total = 0
+            for value in values:
+                txn.postings.append(
+                    data.Posting(value.category, amounts.amount(amounts.negate(value.amount),
+                        "AUD"), None, None, None, None)
                 )
+                total += value.amount
 
-                total = 0
-                for value in values:
-                    txn.postings.append(
-                        data.Posting(value["Category"], amount.Amount(D(value["Amount"])*-1,
-                            "AUD"), None, None, None, None)
-                    )
-                    total += D(value["Amount"])
+            txn.postings.insert(0,
+                data.Posting(key[1], amount.Amount(total,
+                    self.currency), None, None, None, None)
+            )
 
-                txn.postings.insert(0,
-                    data.Posting(key[2], amount.Amount(total,
-                        self.currency), None, None, None, None)
-                )
-
-                entries.append(txn)
+            entries.append(txn)
 
         # 
         # TRANSFERS
         #
 
-        tfr_grouper = itemgetter("Date", "Transfer", "Abs", "Exclude")
-        tfr_sort = sorted(rows, key = tfr_grouper)
-        tfr_list = [
-            {key: list(values)} 
-            for key, values in groupby(tfr_sort, key = tfr_grouper) 
-            if key[1] and not key[3]
-            ]
-
         # Create transfer entries
-        for dict in tfr_list:
-            for index, (key, values) in enumerate(dict.items()):
-                parsed_date = parse_date(key[0])
-                meta = data.new_metadata(f.name, index)
-
-                txn = data.Transaction(
-                    meta=meta,
-                    date=parsed_date,
-                    flag=flags.FLAG_OKAY,
-                    payee=None,
-                    narration="Transfer",
-                    tags=set(),
-                    links=set(),
-                    postings=[],
+        for key, values in tfr_list:
+            parsed_date = parse_date(key[0])
+            meta = data.new_metadata(filepath, 0)
+
+            txn = data.Transaction(
+                meta=meta,
+                date=parsed_date,
+                flag=flags.FLAG_OKAY,
+                payee=None,
+                narration="Transfer",
+                tags=set(),
+                links=set(),
+                postings=[],
+            )
+
+            total = 0
+            for value in values:
+                position = 0 if value.amount < 0 else 1
+                txn.postings.insert(position,
+                    data.Posting(value.account, amounts.amount(value.amount,
+                        self.currency), None, None, None, None)
+                )
+                total += value.amount
+                to_account = value.payee
+
+            # Complete transfer journal using the account specified in the Notes if journal doesn't add up to 0
+            # This will happen if you only export for a single account instead of all accounts
+            x = 1 if total < 0 else 0
+            if total != D(0):
+                txn.postings.insert(x,
+                    data.Posting(to_account, amount.Amount(-total,
+                        self.currency), None, None, None, None)
                 )
 
-                total = 0
-                for value in values:
-                    position = 0 if D(value["Amount"]) < 0 else 1
-                    txn.postings.insert(position,
-                        data.Posting(value["Account"], amount.Amount(D(value["Amount"]),
-                            self.currency), None, None, None, None)
-                    )
-                    total += D(value["Amount"])
-                    to_account = value["Payee"]
-
-                # Complete transfer journal using the account specified in the Notes if journal doesn't add up to 0
-                # This will happen if you only export for a single account instead of all accounts
-                x = 1 if total < 0 else 0
-                if total != D(0):
-                    txn.postings.insert(x,
-                        data.Posting(to_account, amount.Amount(-total,
-                            self.currency), None, None, None, None)
-                    )
-
-                entries.append(txn)
+            entries.append(txn)
+
+        if self.incremental and database:
+            if cursor is not None:
+                store.set(self.database_key(), cursor)
+        elif self.incremental:
+            checkpoint = None
+            if records:
+                checkpoint = checkpoints.checkpoint_at(filepath, start, first_row, records, reread, rows[-1].date)
+            if checkpoint:
+                store.set(self.checkpoint_key(), checkpoint)
 
+        recorder.add('entries', len(entries))
+        recorder.finish(rest='build')
         return entries
 
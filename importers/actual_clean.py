@@ -0,0 +1,117 @@
+import re
+
+# NumPy is optional and only imported once a file is large enough to use it,
+# actual_budget.extract cleans one row at a time without it
+np = None
+
+# Files with fewer rows are cleaned one row at a time, the arrays aren't worth building
+MIN_ROWS = 5000
+
+SPLIT_NOTE = re.compile(r'\(SPLIT \d+ OF \d+\)')
+
+
+def clean_notes(notes):
+    # Split "#tags" off the notes and remove (SPLIT x OF y)
+    # Returns the cleaned notes and the comma separated, lower case tags
+    parse_notes = notes.split("#", 1)
+    notes = parse_notes[0].strip()
+    tags = ""
+    if len(parse_notes) > 1:
+        tags = ', '.join(parse_notes[1].replace(" #", ", ").lower().split(", "))
+    return SPLIT_NOTE.sub('', notes).strip(), tags
+
+
+def _import_numpy():
+    # Returns False if NumPy is not installed
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        np = numpy
+    return np
+
+
+def enabled(rows):
+    return len(rows) >= MIN_ROWS and bool(_import_numpy())
+
+
+def _factorize(values):
+    # Distinct values in first-seen order and each value's index among them
+    # Hashing is much cheaper than np.unique, which sorts object arrays with Python comparisons
+    uniques = list(dict.fromkeys(values))
+    codes = {value: code for code, value in enumerate(uniques)}
+    inverse = np.fromiter(map(codes.__getitem__, values), dtype=np.intp, count=len(values))
+    return uniques, inverse
+
+
+def _lookup(values, func, dtype=object):
+    # Apply func once per distinct value and spread the results back over the column
+    uniques, inverse = _factorize(values)
+    results = np.empty(len(uniques), dtype=dtype)
+    results[:] = [func(value) for value in uniques]
+    return results[inverse]
+
+
+def clean_rows(rows, tables, parse_date, today):
+    # Apply the actual_budget cleaning rules to whole columns at once
+    # Text rules run once per distinct value and the row rules become boolean masks,
+    # the results are the same as the row-wise loop in actual_budget.extract
+    def ledger(account):
+        return tables.ledger.get(account, account)
+
+    account = _lookup([row.account for row in rows], ledger)
+    category = _lookup([row.category for row in rows], ledger)
+
+    uniques, inverse = _factorize([row.notes for row in rows])
+    cleaned = [clean_notes(value) for value in uniques]
+    notes = np.empty(len(cleaned), dtype=object)
+    notes[:] = [value[0] for value in cleaned]
+    notes = notes[inverse]
+    tags = np.empty(len(cleaned), dtype=object)
+    tags[:] = [value[1] for value in cleaned]
+    tags = tags[inverse]
+
+    # If payee is a balance sheet account and there is no category then assume it to be a transfer
+    payees = [row.payee for row in rows]
+    uniques, inverse = _factorize(payees)
+    payee_ledger = np.empty(len(uniques), dtype=object)
+    payee_ledger[:] = [ledger(value) for value in uniques]
+    payee_ledger = payee_ledger[inverse]
+    bs_payee = np.array([value in tables.balance_sheet for value in uniques], dtype=bool)[inverse]
+    has_notes = notes != ""
+    bs_rule = bs_payee & (category == "")
+    transfer = bs_rule & ~has_notes
+    to_category = bs_rule & has_notes
+    payee = np.empty(len(rows), dtype=object)
+    payee[:] = payees
+    payee[transfer] = payee_ledger[transfer]
+    payee[to_category] = ""
+    category = np.where(to_category, payee_ledger, category)
+
+    # If no category
+    no_category = category == ""
+    interest = notes == "Interest on Loan"
+    category[no_category & ~interest] = tables.no_category
+    category[no_category & interest] = tables.loan_interest
+
+    # Exclude Starting Balance, off-budget accounts, rows not cleared, future dates and zero amounts
+    # Like the row-wise loop, exclude holds the reason of the last rule that matched
+    exclude = np.full(len(rows), False, dtype=object)
+    exclude[_lookup(account.tolist(), tables.off_budget.__contains__, bool)] = "off-budget"
+    exclude[payee == "Starting Balance"] = "starting balance"
+    exclude[np.array([row.cleared for row in rows], dtype=object) == "Not cleared"] = "not cleared"
+    exclude[_lookup([row.date for row in rows], lambda value: parse_date(value) > today, bool)] = "future date"
+    exclude[~np.array([row.abs for row in rows], dtype=bool)] = "zero amount"
+
+    columns = zip(rows, account.tolist(), category.tolist(), notes.tolist(), tags.tolist(),
+                  payee.tolist(), transfer.tolist(), exclude.tolist())
+    for row, row_account, row_category, row_notes, row_tags, row_payee, row_transfer, row_exclude in columns:
+        row.account = row_account
+        row.category = row_category
+        row.notes = row_notes
+        row.tags = row_tags
+        row.payee = row_payee
+        row.transfer = row_transfer
+        row.exclude = row_exclude
@@ -0,0 +1,194 @@
+import os
+import pathlib
+import sqlite3
+from datetime import date, timedelta
+
+from .amounts import AmountCache
+from .actual_rows import Row
+
+# Read transactions straight from Actual Budget's local db.sqlite
+#
+# Produces the same Row records as the CSV export from Actual's UI, so the
+# importer's cleaning and grouping rules apply unchanged: account, payee and
+# category names are joined in, dates are YYYY-MM-DD, amounts are the integer
+# cents as Decimals with two places and cleared is "Cleared", "Not cleared" or
+# "Reconciled". Split parents are skipped and their children read, like the export.
+#
+# Every change Actual syncs is a row of messages_crdt with a unique, sortable
+# timestamp. The cursor is the last timestamp read, and a later run with the
+# cursor only reads the transactions of the days that changed since, plus
+# window days either side so transfers and groups on those days are complete.
+# The importer excludes rows dated after today, so with today the cursor stops
+# before the first change to one of them and its day is read again until it comes.
+# Renaming an account, payee or category changes every row that uses it, so
+# a change to one of those tables reads everything again.
+#
+# The database is opened read only, so a running Actual is not disturbed.
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+TABLES = frozenset(('transactions', 'accounts', 'payees', 'categories'))
+
+# Changes to these datasets need a full read, see above
+NAME_DATASETS = ('accounts', 'payees', 'payee_mapping', 'categories', 'category_mapping')
+
+SELECT = """
+SELECT a.name,
+       t.date,
+       CASE WHEN p.transfer_acct IS NOT NULL THEN ta.name ELSE p.name END,
+       t.notes,
+       c.name,
+       t.amount,
+       t.cleared,
+       {reconciled}
+FROM transactions t
+JOIN accounts a ON a.id = t.acct
+LEFT JOIN transactions parent ON parent.id = t.parent_id
+LEFT JOIN payee_mapping pm ON pm.id = COALESCE(t.description, parent.description)
+LEFT JOIN payees p ON p.id = COALESCE(pm.targetId, t.description, parent.description)
+LEFT JOIN accounts ta ON ta.id = p.transfer_acct
+LEFT JOIN category_mapping cm ON cm.id = t.category
+LEFT JOIN categories c ON c.id = COALESCE(cm.transferId, t.category)
+WHERE t.tombstone = 0 AND COALESCE(t.isParent, 0) = 0
+  AND (parent.id IS NULL OR parent.tombstone = 0)
+"""
+
+
+def is_database(filepath):
+    # Return True if filepath is a SQLite database with Actual's tables
+    try:
+        with open(filepath, 'rb') as f:
+            if f.read(len(SQLITE_MAGIC)) != SQLITE_MAGIC:
+                return False
+        db = connect(filepath)
+    except (OSError, sqlite3.Error):
+        return False
+    try:
+        return TABLES.issubset(_tables(db))
+    except sqlite3.Error:
+        return False
+    finally:
+        db.close()
+
+
+def connect(filepath):
+    uri = '{}?mode=ro'.format(pathlib.Path(os.path.abspath(filepath)).as_uri())
+    return sqlite3.connect(uri, uri=True)
+
+
+def _tables(db):
+    return {name for (name,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _columns(db, table):
+    return {row[1] for row in db.execute("PRAGMA table_info({})".format(table))}
+
+
+def _date_text(value):
+    # Actual stores dates as integers such as 20220605
+    value = int(value)
+    return '{:04d}-{:02d}-{:02d}'.format(value // 10000, value // 100 % 100, value % 100)
+
+
+def _date_int(day):
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def last_change(db):
+    # Timestamp of the latest synced change, None for a budget that was never synced
+    if 'messages_crdt' not in _tables(db):
+        return None
+    return db.execute("SELECT MAX(timestamp) FROM messages_crdt").fetchone()[0]
+
+
+def resume_point(db, cursor, today):
+    # The cursor to resume from, before the first change to a transaction dated after today
+    # '' when there is no change before it, which reads everything again
+    first = db.execute("""
+        SELECT MIN(m.timestamp) FROM messages_crdt m JOIN transactions t ON t.id = m.row
+        WHERE m.dataset = 'transactions' AND t.date > ?""", (_date_int(today),)).fetchone()[0]
+    if first is None:
+        return cursor
+    before = db.execute("SELECT MAX(timestamp) FROM messages_crdt WHERE timestamp < ?", (first,)).fetchone()[0]
+    return before or ''
+
+
+def changed_dates(db, since, window=0):
+    # Return the integer dates to read again for the changes after the timestamp since,
+    # or None if everything must be read
+    datasets = dict(db.execute(
+        "SELECT dataset, COUNT(*) FROM messages_crdt WHERE timestamp > ? GROUP BY dataset", (since,)))
+    if any(name in datasets for name in NAME_DATASETS):
+        return None
+
+    # Transactions changed since the cursor and their split parents or children
+    db.execute("CREATE TEMP TABLE changed (id TEXT PRIMARY KEY)")
+    db.execute("""
+        INSERT OR IGNORE INTO changed
+        SELECT DISTINCT row FROM messages_crdt WHERE dataset = 'transactions' AND timestamp > ?""", (since,))
+    dates = set()
+    query = """
+        SELECT t.date FROM transactions t JOIN changed ON changed.id = t.id
+        UNION SELECT t.date FROM transactions t JOIN changed ON changed.id = t.parent_id"""
+    for (value,) in db.execute(query):
+        if value is None:
+            continue
+        day = date(value // 10000, value // 100 % 100, value % 100)
+        for offset in range(-window, window + 1):
+            dates.add(_date_int(day + timedelta(days=offset)))
+    return dates
+
+
+def read_rows(filepath, amounts=None, since=None, window=0, today=None):
+    # Read Actual's transactions into Row records
+    # With since, only the days changed after that timestamp are read
+    # Returns the rows and the cursor to resume from next time, with today the
+    # cursor stops before the changes to transactions dated after today
+    if amounts is None:
+        amounts = AmountCache()
+    db = connect(filepath)
+    try:
+        reconciled = 't.reconciled' if 'reconciled' in _columns(db, 'transactions') else '0'
+        query = SELECT.format(reconciled=reconciled)
+        last = cursor = last_change(db)
+        if last is not None and today is not None:
+            cursor = resume_point(db, last, today)
+
+        if since is not None and last is not None:
+            if last <= since:
+                return [], cursor
+            dates = changed_dates(db, since, window)
+            if dates is not None:
+                if not dates:
+                    return [], cursor
+                db.execute("CREATE TEMP TABLE dates (date INTEGER PRIMARY KEY)")
+                db.executemany("INSERT INTO dates VALUES (?)", ((value,) for value in dates))
+                query += "  AND t.date IN (SELECT date FROM dates)\n"
+        # The order of Actual's transaction list, which the export follows
+        query += "ORDER BY t.date DESC, {}t.id".format(
+            't.sort_order DESC, ' if 'sort_order' in _columns(db, 'transactions') else '')
+
+        # Amounts repeat, each distinct number of cents is formatted once
+        numbers = {}
+        texts = {}
+        rows = []
+        for account, day, payee, notes, category, cents, cleared, reconciled in db.execute(query):
+            number = numbers.get(cents)
+            if number is None:
+                cents = cents or 0
+                sign = '-' if cents < 0 else ''
+                whole, part = divmod(abs(cents), 100)
+                number = numbers[cents] = amounts.number('{}{}.{:02d}'.format(sign, whole, part))
+            text = texts.get(day)
+            if text is None:
+                text = texts[day] = _date_text(day)
+            if reconciled:
+                status = "Reconciled"
+            elif cleared:
+                status = "Cleared"
+            else:
+                status = "Not cleared"
+            rows.append(Row(account or "", text, payee or "", notes or "", category or "", number, status))
+        return rows, cursor
+    finally:
+        db.close()
@@ -0,0 +1,87 @@
+from . import columns
+from .amounts import AmountCache
+from .columns import Column
+
+# Columns read from an Actual Budget CSV export
+# Cleared is optional, older exports don't include it
+COLUMNS = ("Account", "Date", "Payee", "Notes", "Category", "Amount")
+OPTIONAL_COLUMNS = ("Cleared",)
+
+
+class Row:
+    """One row of an Actual Budget export plus the fields added while cleaning it."""
+
+    __slots__ = ("account", "date", "payee", "notes", "category", "amount", "cleared",
+                 "abs", "exclude", "transfer", "tags")
+
+    def __init__(self, account, date, payee, notes, category, amount, cleared):
+        self.account = account
+        self.date = date
+        self.payee = payee
+        self.notes = notes
+        self.category = category
+        self.amount = amount
+        self.cleared = cleared
+        self.abs = abs(amount)
+        self.exclude = False
+        self.transfer = False
+        self.tags = ""
+
+    def __repr__(self):
+        return "Row({})".format(", ".join(
+            "{}={!r}".format(name, getattr(self, name)) for name in self.__slots__))
+
+
+def columns_for(amounts):
+    # Columns read through importers/columns.py, amounts are parsed once here through
+    # the AmountCache and reused by every later stage
+    return tuple(
+        Column(name, amounts.number if name == "Amount" else None) for name in COLUMNS
+    ) + tuple(Column(name, None, "") for name in OPTIONAL_COLUMNS)
+
+
+def rows_from_batch(batch):
+    names = COLUMNS + OPTIONAL_COLUMNS
+    return [Row(*values) for values in batch.rows(*names)]
+
+
+def read_rows(f, amounts=None):
+    # Read an Actual Budget export into Row records
+    if amounts is None:
+        amounts = AmountCache()
+    rows = []
+    for batch in columns.read_batches(f, columns_for(amounts)):
+        rows.extend(rows_from_batch(batch))
+    return rows
+
+
+def rows_from_records(header, records, amounts=None):
+    # Build Row records from parsed CSV records
+    if amounts is None:
+        amounts = AmountCache()
+    plan = columns.ColumnPlan(header, columns_for(amounts))
+    return rows_from_batch(plan.batch(list(records)))
+
+
+def group_rows(rows):
+    # Bucket rows in a single pass: non-transfers by (Date, Account, Payee, Notes, Tags)
+    # and transfers by (Date, Abs). Excluded rows are dropped before they reach a bucket
+    # Only the groups are sorted so the entry order stays deterministic
+    trans_groups = {}
+    tfr_groups = {}
+    for row in rows:
+        if row.exclude:
+            continue
+        if row.transfer:
+            key = (row.date, row.abs)
+            groups = tfr_groups
+        else:
+            key = (row.date, row.account, row.payee, row.notes, row.tags)
+            groups = trans_groups
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [row]
+        else:
+            group.append(row)
+
+    return sorted(trans_groups.items()), sorted(tfr_groups.items())
@@ -0,0 +1,73 @@
+from beancount.core.number import D
+from beancount.core import amount
+
+
+class AmountCache:
+    """Parse each distinct amount string once and share the resulting objects.
+
+    Exports repeat the same handful of amounts thousands of times, so the
+    Decimal for each raw string, its negation and the Amount built from it
+    are created once per file and reused by every posting. Once maxsize
+    distinct strings have been seen the cache starts over, which keeps
+    streaming extracts of huge exports in bounded memory.
+    """
+
+    def __init__(self, maxsize=20000):
+        self.maxsize = maxsize
+        # raw string -> Decimal
+        self._numbers = {}
+        # id of an interned Decimal -> Decimal, keeps the ids below valid
+        self._interned = {}
+        # id of an interned Decimal -> the Decimal multiplied by -1
+        self._negated = {}
+        # (id of an interned Decimal, currency) -> Amount
+        self._amounts = {}
+
+    def clear(self):
+        self._numbers.clear()
+        self._interned.clear()
+        self._negated.clear()
+        self._amounts.clear()
+
+    def _intern(self, number):
+        self._interned[id(number)] = number
+        return number
+
+    def number(self, text):
+        try:
+            return self._numbers[text]
+        except KeyError:
+            if len(self._numbers) >= self.maxsize:
+                self.clear()
+            number = self._numbers[text] = self._intern(D(text))
+            return number
+
+    def negate(self, number):
+        # Same result as number * -1, shared when number came from this cache
+        key = id(number)
+        if self._interned.get(key) is not number:
+            return number * -1
+        try:
+            return self._negated[key]
+        except KeyError:
+            negated = self._negated[key] = self._intern(number * -1)
+            return negated
+
+    def scale(self, number, factor):
+        # Same result as number * factor for the int multipliers in the mapping files
+        if factor == 1:
+            return number
+        if factor == -1:
+            return self.negate(number)
+        return number * factor
+
+    def amount(self, number, currency):
+        # Same result as amount.Amount(number, currency), shared when number came from this cache
+        key = id(number)
+        if self._interned.get(key) is not number:
+            return amount.Amount(number, currency)
+        try:
+            return self._amounts[key, currency]
+        except KeyError:
+            value = self._amounts[key, currency] = amount.Amount(number, currency)
+            return value
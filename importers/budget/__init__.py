@@ -5,13 +5,17 @@ from beancount.core import amount
 from beancount.core import flags
 from beancount.core import data
 
-import csv
 import os
 import re
 
-from datetime import datetime
-from itertools import chain, groupby
-from operator import itemgetter
+from itertools import chain
+
+from .. import extract_cache
+from .. import mappings
+from .. import registry
+from ..amounts import AmountCache
+from ..actual_rows import read_rows, group_rows
+from ..dates import DateParser
 
 home_directory = os.path.expanduser( '~' )
 CSV_HEADER = "Account,Date,Payee,Notes,Category,Amount,Cleared"
@@ -20,44 +24,23 @@ BEAN_DATA_DIR = os.path.join(LEDGER_DATA_DIR, "mappings")
 ACCOUNT_MAP = "actual_budget_mappings.csv"
 MAP_HEADER = "Budget Account,Ledger Account,Off-Budget"
 
-def parse_date(text):
-    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
-        try:
-            return datetime.strptime(text, fmt).date()
-        except ValueError:
-            pass
-    raise ValueError('no valid date format found')
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y')
 
 class ActualBudgetImporter(importer.ImporterProtocol):
+    header_signature = registry.ACTUAL_BUDGET
+
     def __init__(self, currency='AUD', file_encoding='utf-8'):
         self.currency = currency
         self.file_encoding = file_encoding
 
     def identify(self, file_):
-        with open(file_.name, encoding=self.file_encoding) as f:
-            header = f.readline().strip()
-        
-        headers = header.split(',')
-        csv_headers = CSV_HEADER.split(',')
-
         # return True is all csv_headers in file_headers
-        return all(h in headers for h in csv_headers)
+        return registry.matches(self.header_signature, file_.name, self.file_encoding)
 
     def get_account_map(self):
         # Get account mapping for Budget accounts --> Ledger accounts
-        # CSV should contain three columns "Budget Account, Ledger Account, Off-Budget"
-        # 1nd Column (Budget Acount) will be the key
-        try:
-            found_csv = os.path.exists(ACCOUNT_MAP)
-            csv_path = BEAN_DATA_DIR + "/" if not found_csv else ""
-            with open(csv_path + "/" + ACCOUNT_MAP) as f:
-                header = f.readline().strip()
-                if re.match(header, MAP_HEADER):
-                    reader = csv.reader(f)
-                    account_map = {rows[0]: {'Ledger Account': rows[1], 'Off-Budget': rows[2]} for rows in reader}
-            return account_map
-        except:
-            return False
+        # The parsed table is cached and only reloaded when the mapping file changes
+        return mappings.load(ACCOUNT_MAP, BEAN_DATA_DIR, mappings.parse_account_map)
 
     def off_budget_accounts(self, account_map):
         if account_map:
@@ -71,8 +54,7 @@ class ActualBudgetImporter(importer.ImporterProtocol):
 
     def get_ledger_account(self, account_map, account):
         try:
-            account_map = self.get_account_map()
-            if account_map: 
+            if account_map:
                 return account_map[account]["Ledger Account"]
             return account
         except KeyError:
@@ -89,10 +71,16 @@ class ActualBudgetImporter(importer.ImporterProtocol):
         except KeyError:
             return False
 
+    @extract_cache.cached(lambda self: [(ACCOUNT_MAP, BEAN_DATA_DIR)])
     def extract(self, f):
-        # Store csv rows in dict
-        with open(f.name, mode='r') as f:
-            rows = [row for row in csv.DictReader(f)]
+        # Store csv rows as Row records
+        with open(f.name, encoding=self.file_encoding, newline='') as f:
+            amounts = AmountCache()
+            rows = read_rows(f, amounts)
+
+        # Detect the date format once for the file
+        parse_date = DateParser(DATE_FORMATS)
+        parse_date.detect(row.date for row in rows)
 
         # Get account mappings
         account_map = self.get_account_map()
@@ -101,160 +89,131 @@ class ActualBudgetImporter(importer.ImporterProtocol):
         # Clean up data
         for index, row in enumerate(rows):
             # Change accounts based on account mapping details
-            row["Account"] = self.get_ledger_account(account_map, row["Account"])
-            row["Category"] = self.get_ledger_account(account_map, row["Category"])
-
-            # Create key with absolute values
-            row["Abs"] = abs(D(row["Amount"]))
-
-            # Create exclude key
-            row["Exclude"] = False
-
-            # Create is_transfer key
-            row["Transfer"] = False
+            row.account = self.get_ledger_account(account_map, row.account)
+            row.category = self.get_ledger_account(account_map, row.category)
 
             # Parse notes for tags
-            parse_notes = row["Notes"].split("#", 1)
-            row["Notes"] = parse_notes[0].strip()
-            row["Tags"] = ""
+            parse_notes = row.notes.split("#", 1)
+            row.notes = parse_notes[0].strip()
             if len(parse_notes) > 1:
                 tags = parse_notes[1]
-                row["Tags"] = tags.replace(" #", ", ").lower()
-                row["Tags"] = tuple(row["Tags"].split(", "))
-
-            row["Tags"] = ', '.join(row["Tags"])
+                row.tags = ', '.join(tags.replace(" #", ", ").lower().split(", "))
 
             # Remove (SPLIT x OF y) in notes
-            row["Notes"] = re.sub(r'\(SPLIT \d+ OF \d+\)', '', row["Notes"]).strip()
+            row.notes = re.sub(r'\(SPLIT \d+ OF \d+\)', '', row.notes).strip()
 
             # If payee is a balance sheet account and there is no cateogry then assume it to be a transfer
-            if self.is_bs_account(account_map, row['Payee']) and not row['Category']:
-                if not row['Notes']:
-                    row['Transfer'] = True
-                    row["Payee"] = self.get_ledger_account(account_map, row["Payee"])
+            if self.is_bs_account(account_map, row.payee) and not row.category:
+                if not row.notes:
+                    row.transfer = True
+                    row.payee = self.get_ledger_account(account_map, row.payee)
 
-                if row['Notes']:
-                    row['Category'] = self.get_ledger_account(account_map, row["Payee"])
-                    row['Payee'] = ""
+                if row.notes:
+                    row.category = self.get_ledger_account(account_map, row.payee)
+                    row.payee = ""
 
             # If no category
-            if not row['Category'] and not row['Notes'] == "Interest on Loan":
-                row['Category'] = self.get_ledger_account(account_map, "No Category")
+            if not row.category and not row.notes == "Interest on Loan":
+                row.category = self.get_ledger_account(account_map, "No Category")
 
-            if not row['Category'] and row['Notes'] == "Interest on Loan":
-                row['Category'] = self.get_ledger_account(account_map, "Bank Loan Interest")
+            if not row.category and row.notes == "Interest on Loan":
+                row.category = self.get_ledger_account(account_map, "Bank Loan Interest")
 
             # Exclude if Payee = Starting Balance or account is an Off-budget account
-            if row['Payee'] == "Starting Balance" or row["Account"] in off_budget_accounts:
-                row['Exclude'] = True
+            if row.payee == "Starting Balance" or row.account in off_budget_accounts:
+                row.exclude = True
 
             # Exclude all but cleared transactions
-            if row['Cleared'] == "Reconciled" or row['Cleared'] == "Not cleared":
-                row['Exclude'] = True
+            if row.cleared == "Reconciled" or row.cleared == "Not cleared":
+                row.exclude = True
 
             # Exclude if Abs = 0
-            if row['Abs'] == 0:
-                row['Exclude'] = True
+            if row.abs == 0:
+                row.exclude = True
+
+        # Group rows for postings if the specified columns match
+        trans_list, tfr_list = group_rows(rows)
 
         #
         # NON-TRANSFERS
         #
 
-        # Group rows for postings if the specified columns match
-        trans_grouper = itemgetter("Date", "Transfer", "Account", "Payee", "Notes", "Tags", "Exclude")
-        trans_sort = sorted(rows, key = trans_grouper)
-        trans_list = [
-            {key: list(values)} 
-            for key, values in groupby(trans_sort, key = trans_grouper) 
-            if not key[1] and not key[6]
-            ]
-
         # Create entries
         # Create transaction entries
         entries = []
-        for dict in trans_list:
-            for index, (key, values) in enumerate(dict.items()):
-                parsed_date = parse_date(key[0])
-                trans_payee = key[3]
-                trans_narration = key[4]
-                trans_tags = key[5]
-
-                meta = data.new_metadata(f.name, index)
-
-                txn = data.Transaction(
-                    meta=meta,
-                    date=parsed_date,
-                    flag=flags.FLAG_OKAY,
-                    payee=trans_payee,
-                    narration=trans_narration,
-                    tags=set(filter(None, trans_tags.split(", "))),
-                    links=set(),
-                    postings=[],
+        for key, values in trans_list:
+            parsed_date = parse_date(key[0])
+            trans_payee = key[2]
+            trans_narration = key[3]
+            trans_tags = key[4]
+
+            meta = data.new_metadata(f.name, 0)
+
+            txn = data.Transaction(
+                meta=meta,
+                date=parsed_date,
+                flag=flags.FLAG_OKAY,
+                payee=trans_payee,
+                narration=trans_narration,
+                tags=set(filter(None, trans_tags.split(", "))),
+                links=set(),
+                postings=[],
+            )
+
+            total = 0
+            for value in values:
+                txn.postings.append(
+                    data.Posting(value.category, amounts.amount(amounts.negate(value.amount),
+                        "AUD"), None, None, None, None)
                 )
+                total += value.amount
 
-                total = 0
-                for value in values:
-                    txn.postings.append(
-                        data.Posting(value["Category"], amount.Amount(D(value["Amount"])*-1,
-                            "AUD"), None, None, None, None)
-                    )
-                    total += D(value["Amount"])
-
-                txn.postings.insert(0,
-                    data.Posting(key[2], amount.Amount(total,
-                        self.currency), None, None, None, None)
-                )
+            txn.postings.insert(0,
+                data.Posting(key[1], amount.Amount(total,
+                    self.currency), None, None, None, None)
+            )
 
-                entries.append(txn)
+            entries.append(txn)
 
         # 
         # TRANSFERS
         #
 
-        tfr_grouper = itemgetter("Date", "Transfer", "Abs", "Exclude")
-        tfr_sort = sorted(rows, key = tfr_grouper)
-        tfr_list = [
-            {key: list(values)} 
-            for key, values in groupby(tfr_sort, key = tfr_grouper) 
-            if key[1] and not key[3]
-            ]
-
         # Create transfer entries
-        for dict in tfr_list:
-            for index, (key, values) in enumerate(dict.items()):
-                parsed_date = parse_date(key[0])
-                meta = data.new_metadata(f.name, index)
-
-                txn = data.Transaction(
-                    meta=meta,
-                    date=parsed_date,
-                    flag=flags.FLAG_OKAY,
-                    payee=None,
-                    narration="Transfer",
-                    tags=set(),
-                    links=set(),
-                    postings=[],
+        for key, values in tfr_list:
+            parsed_date = parse_date(key[0])
+            meta = data.new_metadata(f.name, 0)
+
+            txn = data.Transaction(
+                meta=meta,
+                date=parsed_date,
+                flag=flags.FLAG_OKAY,
+                payee=None,
+                narration="Transfer",
+                tags=set(),
+                links=set(),
+                postings=[],
+            )
+
+            total = 0
+            for value in values:
+                position = 0 if value.amount < 0 else 1
+                txn.postings.insert(position,
+                    data.Posting(value.account, amounts.amount(value.amount,
+                        self.currency), None, None, None, None)
+                )
+                total += value.amount
+                to_account = value.payee
+
+            # Complete transfer journal using the account specified in the Notes if journal doesn't add up to 0
+            # This will happen if you only export for a single account instead of all accounts
+            x = 1 if total < 0 else 0
+            if total != D(0):
+                txn.postings.insert(x,
+                    data.Posting(to_account, amount.Amount(-total,
+                        self.currency), None, None, None, None)
                 )
 
-                total = 0
-                for value in values:
-                    position = 0 if D(value["Amount"]) < 0 else 1
-                    txn.postings.insert(position,
-                        data.Posting(value["Account"], amount.Amount(D(value["Amount"]),
-                            self.currency), None, None, None, None)
-                    )
-                    total += D(value["Amount"])
-                    to_account = value["Payee"]
-
-                # Complete transfer journal using the account specified in the Notes if journal doesn't add up to 0
-                # This will happen if you only export for a single account instead of all accounts
-                x = 1 if total < 0 else 0
-                if total != D(0):
-                    txn.postings.insert(x,
-                        data.Posting(to_account, amount.Amount(-total,
-                            self.currency), None, None, None, None)
-                    )
-
-                entries.append(txn)
+            entries.append(txn)
 
         return entries
\ No newline at end of file
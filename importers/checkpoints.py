@@ -0,0 +1,123 @@
+import csv
+import hashlib
+import json
+import os
+
+# Checkpoints for incremental imports of append-only exports
+#
+# Each checkpoint records how far into an export the last run got: the byte
+# offset, a SHA-256 of the bytes before it and the date of the last row.
+# A later run re-hashes that prefix and, if it is unchanged, only parses the
+# rows after it. Any change to the prefix falls back to a full run.
+#
+# The checkpoint stops before the rows of the file's last date, so a day that
+# was still being filled in is re-read in full next time. Entries re-emitted
+# for that day are marked by the importers' duplicate detection.
+
+CHUNK_SIZE = 1 << 20
+
+
+def prefix_hash(filepath, offset):
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        remaining = offset
+        while remaining:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.hexdigest()
+
+
+class Store:
+    """Checkpoints saved as JSON, one per source key."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        return self._load().get(key)
+
+    def set(self, key, checkpoint):
+        checkpoints = self._load()
+        checkpoints[key] = checkpoint
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(checkpoints, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def resume(filepath, checkpoint):
+    # Return the byte offset and row number to resume from
+    # Returns (0, 0) if the file doesn't start with the checkpointed prefix
+    if not checkpoint:
+        return 0, 0
+    offset = checkpoint['offset']
+    if os.path.getsize(filepath) < offset:
+        return 0, 0
+    if prefix_hash(filepath, offset) != checkpoint['sha256']:
+        return 0, 0
+    return offset, checkpoint['rows']
+
+
+def read_records(filepath, encoding, offset=0):
+    # Return the header and the (record, end offset) pairs of the CSV records after offset
+    # offset 0 starts after the header. Blank lines are skipped
+    with open(filepath, 'rb') as f:
+        first = f.readline()
+        header = next(csv.reader([first.decode(encoding)]), [])
+        position = max(offset, len(first))
+        f.seek(position)
+
+        # csv.reader pulls one line at a time and stops at the end of each record,
+        # so the bytes consumed so far give the end offset of the record just read
+        consumed = [position]
+
+        def lines():
+            for line in f:
+                consumed[0] += len(line)
+                yield line.decode(encoding)
+
+        records = []
+        for record in csv.reader(lines()):
+            if record:
+                records.append((record, consumed[0]))
+    return header, records
+
+
+def checkpoint_for(filepath, start, first_row, records, dates):
+    # Build the checkpoint after a run that read records from offset start and row first_row
+    # dates holds the date string of each record
+    if not records:
+        return None
+
+    last_date = dates[-1]
+    index = len(records) - 1
+    while index > 0 and dates[index - 1] == last_date:
+        index -= 1
+    return checkpoint_at(filepath, start, first_row, records, index, last_date)
+
+
+def checkpoint_at(filepath, start, first_row, records, index, last_date):
+    # Build the checkpoint that reads records[index:] again next run
+    if index:
+        offset, rows = records[index - 1][1], first_row + index
+    else:
+        offset, rows = start, first_row
+    if not offset:
+        return None
+
+    return {
+        'offset': offset,
+        'rows': rows,
+        'sha256': prefix_hash(filepath, offset),
+        'last_date': last_date,
+    }
@@ -0,0 +1,112 @@
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import beangulp
+from beangulp import cache
+
+from . import stats
+
+# Parse one large export in several processes
+#
+# The records after the header are split into byte ranges that start and end on
+# record boundaries, each range is extracted in a worker and the entries are put
+# back together in file order. Each worker numbers its rows from 0, so the parent
+# shifts the line numbers in the entries' metadata by the rows of the ranges before.
+#
+# Used by the importers that turn every row into its own transaction
+# (coinspot, crypto and ioof_super), see their jobs argument.
+
+# Files are only split into ranges of at least this many bytes
+MIN_RANGE = 1 << 20
+
+# Bytes counted at a time while looking for quotes
+SCAN_SIZE = 1 << 20
+
+
+def _count_quotes(mm, start, end):
+    count = 0
+    for position in range(start, end, SCAN_SIZE):
+        count += mm[position:min(position + SCAN_SIZE, end)].count(b'"')
+    return count
+
+
+def split(filepath, parts):
+    # Return up to parts (start, end) byte ranges covering the records after the header
+    # A newline ends a record when the number of quotes before it is even, so newlines in
+    # quoted fields never split a record ("" escapes add two quotes and keep the parity)
+    with open(filepath, 'rb') as f:
+        header_end = len(f.readline())
+        size = os.fstat(f.fileno()).st_size
+        parts = max(1, min(parts, (size - header_end) // MIN_RANGE))
+        if parts == 1:
+            return [(header_end, size)]
+
+        offsets = [header_end]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            position = header_end
+            quotes = 0
+            for part in range(1, parts):
+                target = header_end + (size - header_end) * part // parts
+                if target > position:
+                    quotes += _count_quotes(mm, position, target)
+                    position = target
+                while position < size:
+                    newline = mm.find(b'\n', position)
+                    end = size if newline == -1 else newline + 1
+                    quotes += _count_quotes(mm, position, end)
+                    position = end
+                    if quotes % 2 == 0:
+                        break
+                if position >= size:
+                    break
+                offsets.append(position)
+        offsets.append(size)
+    return list(zip(offsets, offsets[1:]))
+
+
+def _iter_range(importer, filepath, start, end):
+    if isinstance(importer, beangulp.Importer):
+        return importer.iter_extract(filepath, start=start, end=end)
+    # The legacy importers only use the name of the file object
+    return importer.iter_extract(cache.get_file(filepath), start=start, end=end)
+
+
+def extract_range(importer, filepath, start, end):
+    # Extract the records of one range
+    # Returns the entries, the number of rows read and the stats records
+    entries = []
+    iterator = _iter_range(importer, filepath, start, end)
+    while True:
+        try:
+            entries.append(next(iterator))
+        except StopIteration as stop:
+            # iter_extract returns the number of rows it read
+            rows = stop.value
+            break
+    return entries, rows, stats.collect()
+
+
+def extract(importer, filepath, jobs):
+    # Extract filepath in up to jobs processes, the entries are the same as a serial run
+    ranges = split(filepath, jobs)
+    if len(ranges) == 1:
+        return list(_iter_range(importer, filepath, 0, None))
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with ProcessPoolExecutor(len(ranges), mp_context=context) as executor:
+        futures = [executor.submit(extract_range, importer, filepath, start, end) for start, end in ranges]
+
+        entries = []
+        first_row = 0
+        for future in futures:
+            chunk, rows, records = future.result()
+            if first_row:
+                for entry in chunk:
+                    entry.meta['lineno'] += first_row
+            entries.extend(chunk)
+            first_row += rows
+            stats.merge(records)
+    return entries
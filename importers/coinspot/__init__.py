@@ -1,48 +1,77 @@
 
-from beancount.core.number import D
 from beancount.ingest import importer
-from beancount.core import amount
 from beancount.core.position import Cost
 from beancount.core import flags
 from beancount.core import data
 
-import csv
 import os
 import re
-from datetime import datetime
 from itertools import chain, groupby
 from operator import itemgetter
 
+from .. import chunks
+from .. import columns
+from .. import extract_cache
+from .. import lots
+from .. import registry
+from .. import stats
+from ..amounts import AmountCache
+from ..columns import Column
+from ..dates import DateParser
+
 CSV_HEADER = ["Transaction Date","Type","Market","Amount","Rate inc. fee","Rate ex. fee","Fee","Fee AUD (inc GST)","GST AUD","Total AUD","Total (inc GST)"]
+DATE_FORMATS = ('%d/%m/%Y',)
+ASSET_ACCOUNT = "Assets:Crypto:CoinSpot:"
+GAINS_ACCOUNT = "Income:Crypto:Gains"
 
 class CoinSpotImporter(importer.ImporterProtocol):
-    def __init__(self, file_encoding='utf-8-sig'):
+    header_signature = registry.COINSPOT
+
+    def __init__(self, file_encoding='utf-8-sig', jobs=1, lots=None):
         self.file_encoding = file_encoding
+        # Parse large files in up to jobs processes, see importers/chunks.py
+        self.jobs = jobs
+        # Book sells against FIFO lots, see importers/lots.py
+        # "file" uses the buys in the same file, "ledger" also the lots held in the existing ledger
+        self.lots = lots
 
     def identify(self, file_):
-        with open(file_.name, encoding=self.file_encoding) as f:
-            header = f.readline().strip().split(',')
-
-        return header == CSV_HEADER
-
-    def extract(self, file_):
-        # Create entries
-        # Create transaction entries
-        entries = []
-        
-        with open(file_.name, mode='r', encoding=self.file_encoding) as f:
-            for index, row in enumerate(csv.DictReader(f)):
-                parsed_date = datetime.strptime(row["Transaction Date"], '%d/%m/%Y').date()
-                trans_type = row["Type"]
-                market = row["Market"]
-                amnt = row["Amount"]
-                rate_inc = row["Rate inc. fee"]
-                rate_ex = row["Rate ex. fee"]
-                fee = row["Fee"]
-                total_aud = row["Total AUD"]
+        return registry.matches(self.header_signature, file_.name, self.file_encoding)
+
+    # Sells booked against the existing ledger depend on it, so they aren't cached
+    @extract_cache.cached(skip=lambda self: self.lots == "ledger")
+    def extract(self, file_, existing_entries=None):
+        if self.jobs > 1:
+            entries = chunks.extract(self, file_.name, self.jobs)
+        else:
+            entries = list(self.iter_extract(file_))
+        if self.lots:
+            existing = existing_entries if self.lots == "ledger" else None
+            entries = lots.book(entries, ASSET_ACCOUNT, GAINS_ACCOUNT, existing)
+        return entries
+
+    def iter_extract(self, file_, start=0, end=None):
+        # Yield entries one row at a time so large exports run in constant memory
+        # start and end limit the rows to a byte range and the number of rows read is returned
+        parse_date = DateParser(DATE_FORMATS)
+        amounts = AmountCache()
+        recorder = stats.recorder(self, file_.name)
+        rows = 0
+        emitted = 0
+
+        # Amounts and rates are kept as text for the narration and parsed where they are posted
+        names = ("Transaction Date", "Type", "Market", "Amount", "Rate inc. fee", "Rate ex. fee", "Fee", "Total AUD")
+        batches = columns.read_range(
+            file_.name, [Column(name, parse_date if name == "Transaction Date" else None) for name in names],
+            self.file_encoding, start, end)
+
+        for batch in recorder.timed(batches, 'read'):
+            rows += len(batch)
+            for index, row in enumerate(batch.rows(*names), batch.start):
+                parsed_date, trans_type, market, amnt, rate_inc, rate_ex, fee, total_aud = row
 
                 narrate = " ".join([trans_type,amnt,market,"at",rate_inc,"AUD (incl. fee)"])
-                meta = data.new_metadata(f.name, index, {"rate_ex": rate_ex + ' AUD', "brokerage": fee})
+                meta = data.new_metadata(file_.name, index, {"rate_ex": rate_ex + ' AUD', "brokerage": fee})
 
                 coin = market.split("/")[0]
 
@@ -59,27 +88,33 @@ class CoinSpotImporter(importer.ImporterProtocol):
 
                 if trans_type == "Buy":
                     txn.postings.insert(0,
-                        data.Posting("Assets:Crypto:CoinSpot:" + coin, amount.Amount(D(amnt),
-                            coin), Cost(D(rate_inc), 'AUD', None, None), None, None, None)
+                        data.Posting(ASSET_ACCOUNT + coin, amounts.amount(amounts.number(amnt),
+                            coin), Cost(amounts.number(rate_inc), 'AUD', None, None), None, None, None)
                     )
                     txn.postings.insert(1,
-                        data.Posting("Assets:Crypto:CoinSpot:Cash", amount.Amount(D(total_aud)*-1,
+                        data.Posting("Assets:Crypto:CoinSpot:Cash", amounts.amount(amounts.negate(amounts.number(total_aud)),
                             'AUD'), None, None, None, None)
                     )
-                    entries.append(txn)
+                    emitted += 1
+                    yield txn
 
                 if trans_type == "Sell":
                     txn.postings.insert(0,
-                        data.Posting("Assets:Crypto:CoinSpot:" + coin, amount.Amount(D(amnt)*-1,
-                            coin), Cost(None, 'AUD', None, None), amount.Amount(D(rate_inc), 'AUD'), None, None)
+                        data.Posting(ASSET_ACCOUNT + coin, amounts.amount(amounts.negate(amounts.number(amnt)),
+                            coin), Cost(None, 'AUD', None, None), amounts.amount(amounts.number(rate_inc), 'AUD'), None, None)
                     )
                     txn.postings.insert(1,
-                        data.Posting("Assets:Crypto:CoinSpot:Cash", amount.Amount(D(total_aud),
+                        data.Posting("Assets:Crypto:CoinSpot:Cash", amounts.amount(amounts.number(total_aud),
                             'AUD'), None, None, None, None)
                     )
                     txn.postings.insert(2,
-                        data.Posting("Income:Crypto:Gains", None, None, None, None, None)
+                        data.Posting(GAINS_ACCOUNT, None, None, None, None, None)
                     )
-                    entries.append(txn)
+                    emitted += 1
+                    yield txn
 
-        return entries
\ No newline at end of file
+        # Time spent by the caller between entries is counted as build
+        recorder.add('rows', rows)
+        recorder.add('entries', emitted)
+        recorder.finish(rest='build')
+        return rows
@@ -0,0 +1,153 @@
+import csv
+from collections import namedtuple
+
+# Shared CSV ingestion for the importers
+#
+# Each importer lists the columns it reads. The header is resolved once into a
+# ColumnPlan of indices and converters, and rows are read with csv.reader in
+# batches of converted columns. Decoding is the same for every importer: files
+# are opened with the importer's encoding and newline='', and a leading BOM is
+# dropped from the header even when the encoding doesn't strip it.
+
+BATCH_SIZE = 4096
+
+REQUIRED = object()
+
+# convert is called with each raw string, None keeps the string
+# Columns with a default are optional and take the default when missing from the header
+Column = namedtuple('Column', ['name', 'convert', 'default'], defaults=(None, REQUIRED))
+
+
+class Batch:
+    """Converted columns of consecutive rows, start is the index of the first row in the file."""
+
+    __slots__ = ('columns', 'start', 'size')
+
+    def __init__(self, columns, start, size):
+        self.columns = columns
+        self.start = start
+        self.size = size
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return self.size
+
+    def rows(self, *names):
+        # Iterate over the rows of the named columns as tuples
+        return zip(*(self.columns[name] for name in names))
+
+
+def clean_header(header):
+    header = [name.strip() for name in header]
+    if header:
+        header[0] = header[0].lstrip('\ufeff')
+    return header
+
+
+def read_header(filepath, encoding='utf-8-sig'):
+    # Return the cleaned header of filepath, for importers whose columns depend on it
+    with open(filepath, encoding=encoding, newline='') as f:
+        return clean_header(next(csv.reader(f), []))
+
+
+class ColumnPlan:
+    """Column indices and converters resolved once from a file's header."""
+
+    def __init__(self, header, columns):
+        header = clean_header(header)
+        self.columns = columns
+        self.indices = []
+        for column in columns:
+            if column.name in header:
+                self.indices.append(header.index(column.name))
+            elif column.default is REQUIRED:
+                raise ValueError('missing column {!r}'.format(column.name))
+            else:
+                self.indices.append(None)
+        self.width = len(header)
+
+    def prepare(self, records):
+        # Let converters that need a sample of raw values (such as DateParser.detect) see the first rows
+        for column, index in zip(self.columns, self.indices):
+            detect = getattr(column.convert, 'detect', None)
+            if detect is not None and index is not None:
+                detect(record[index] for record in records)
+
+    def batch(self, records, start=0):
+        # Convert a list of raw records into a Batch of columns
+        width = self.width
+        records = [
+            record if len(record) >= width else record + [''] * (width - len(record))
+            for record in records if record
+        ]
+        columns = {}
+        for column, index in zip(self.columns, self.indices):
+            if index is None:
+                values = [column.default] * len(records)
+            elif column.convert is None:
+                values = [record[index] for record in records]
+            else:
+                convert = column.convert
+                values = [convert(record[index]) for record in records]
+            columns[column.name] = values
+        return Batch(columns, start, len(records))
+
+
+def _batches(reader, plan, batch_size):
+    start = 0
+    first = True
+    while True:
+        records = []
+        for record in reader:
+            if record:
+                records.append(record)
+                if len(records) == batch_size:
+                    break
+        if not records:
+            return
+        if first:
+            plan.prepare(records)
+            first = False
+        batch = plan.batch(records, start)
+        start += len(batch)
+        yield batch
+
+
+def read_batches(f, columns, batch_size=BATCH_SIZE):
+    # Yield Batches of converted columns from an open text file
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    yield from _batches(reader, ColumnPlan(header, columns), batch_size)
+
+
+def read_file(filepath, columns, encoding='utf-8-sig', batch_size=BATCH_SIZE):
+    # Yield Batches of converted columns from filepath
+    with open(filepath, encoding=encoding, newline='') as f:
+        yield from read_batches(f, columns, batch_size)
+
+
+def read_range(filepath, columns, encoding='utf-8-sig', start=0, end=None, batch_size=BATCH_SIZE):
+    # Yield Batches of the records between the byte offsets start and end of filepath
+    # Both offsets must be record boundaries, start 0 begins after the header
+    # Batch.start counts from the first record of the range
+    with open(filepath, 'rb') as f:
+        first = f.readline()
+        header = next(csv.reader([first.decode(encoding)]), None)
+        if header is None:
+            return
+        position = max(start, len(first))
+        f.seek(position)
+
+        def lines():
+            nonlocal position
+            for line in f:
+                if end is not None and position >= end:
+                    return
+                position += len(line)
+                yield line.decode(encoding)
+
+        yield from _batches(csv.reader(lines()), ColumnPlan(header, columns), batch_size)
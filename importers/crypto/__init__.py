@@ -1,129 +1,157 @@
 
-from beancount.core.number import D
 from beancount.ingest import importer
 from beancount.core import amount
 from beancount.core.position import Cost
 from beancount.core import flags
 from beancount.core import data
 
-import csv
 import os
 import re
-from datetime import datetime
 from itertools import chain, groupby
 from operator import itemgetter
 
+from .. import chunks
+from .. import columns
+from .. import extract_cache
+from .. import registry
+from .. import stats
+from ..amounts import AmountCache
+from ..columns import Column
+from ..dates import DateParser
+
 CSV_HEADER = "Id,Wallet,Transaction Date,Type,Subtype,Asset,Amount,Costbase,Remarks,Txid,Realised.TAX_GAIN"
+DATE_FORMATS = ('%d/%m/%Y',)
 
 class CryptoImporter(importer.ImporterProtocol):
-    def __init__(self, file_encoding='utf-8-sig'):
+    header_signature = registry.CRYPTO
+
+    def __init__(self, file_encoding='utf-8-sig', jobs=1):
         self.file_encoding = file_encoding
+        # Parse large files in up to jobs processes, see importers/chunks.py
+        self.jobs = jobs
 
     def identify(self, file_):
-        with open(file_.name, encoding=self.file_encoding) as f:
-            header = f.readline().strip().split(',')
-            csv_header = CSV_HEADER.strip().split(',')
-        return header == csv_header
+        return registry.matches(self.header_signature, file_.name, self.file_encoding)
 
+    @extract_cache.cached()
     def extract(self, file_):
-        # Store csv rows in dict
-        with open(file_.name, mode='r', encoding=self.file_encoding) as f:
-            rows = [row for row in csv.DictReader(f)]
-
-        entries = []
-        for index, row in enumerate(rows):
-            txid = row["Txid"]
-            wallet = row["Wallet"]
-            parsed_date = datetime.strptime(row["Transaction Date"], '%d/%m/%Y').date()
-            txtype = row["Type"]
-            subtype = row["Subtype"]
-            asset = row["Asset"].split("#")[0]
-            ledger_asset = "Assets:Crypto:" + asset
-            amnt = D(row["Amount"])
-            cost = D(row["Costbase"])
-            cost = cost if amnt > 0 else cost * -1
-            price = cost / amnt
-            tax_gain = D(row["Realised.TAX_GAIN"])
-            remarks = row["Remarks"]
-
-            meta = data.new_metadata(f.name, index, {"txid": txid})
-
-            narrate = " - ".join([wallet, txtype, subtype, remarks])
-
-            txn = data.Transaction(
-                meta=meta,
-                date=parsed_date,
-                flag=flags.FLAG_OKAY,
-                payee="",
-                narration=narrate,
-                tags=set(),
-                links=set(),
-                postings=[],
-            )
-
-
-            if amnt > 0:
-                txn.postings.insert(0, data.Posting(
-                    ledger_asset,
-                    amount.Amount(amnt, asset),
-                    Cost(price, 'AUD', None, None),
-                    None,
-                    None,
-                    None
-                )
+        if self.jobs > 1:
+            return chunks.extract(self, file_.name, self.jobs)
+        return list(self.iter_extract(file_))
+
+    def iter_extract(self, file_, start=0, end=None):
+        # Yield entries one row at a time so large exports run in constant memory
+        # start and end limit the rows to a byte range and the number of rows read is returned
+        parse_date = DateParser(DATE_FORMATS)
+        amounts = AmountCache()
+        recorder = stats.recorder(self, file_.name)
+        rows = 0
+        emitted = 0
+
+        names = ("Txid", "Wallet", "Transaction Date", "Type", "Subtype", "Asset",
+                 "Amount", "Costbase", "Realised.TAX_GAIN", "Remarks")
+        convert = {
+            "Transaction Date": parse_date,
+            "Amount": amounts.number,
+            "Costbase": amounts.number,
+            "Realised.TAX_GAIN": amounts.number,
+        }
+        batches = columns.read_range(
+            file_.name, [Column(name, convert.get(name)) for name in names], self.file_encoding, start, end)
+
+        for batch in recorder.timed(batches, 'read'):
+            rows += len(batch)
+            for index, row in enumerate(batch.rows(*names), batch.start):
+                txid, wallet, parsed_date, txtype, subtype, asset, amnt, cost, tax_gain, remarks = row
+                asset = asset.split("#")[0]
+                ledger_asset = "Assets:Crypto:" + asset
+                cost = cost if amnt > 0 else amounts.negate(cost)
+                price = cost / amnt
+
+                meta = data.new_metadata(file_.name, index, {"txid": txid})
+
+                narrate = " - ".join([wallet, txtype, subtype, remarks])
+
+                txn = data.Transaction(
+                    meta=meta,
+                    date=parsed_date,
+                    flag=flags.FLAG_OKAY,
+                    payee="",
+                    narration=narrate,
+                    tags=set(),
+                    links=set(),
+                    postings=[],
                 )
-                ledger_account = "Assets:Crypto:Cash" if txtype == "Buy" else "Income:Crypto:Market-Movement"
-                if txtype != "Earn":
+
+
+                if amnt > 0:
                     txn.postings.insert(0, data.Posting(
-                        ledger_account,
-                        amount.Amount(-cost, 'AUD'),
-                        None,
+                        ledger_asset,
+                        amounts.amount(amnt, asset),
+                        Cost(price, 'AUD', None, None),
                         None,
                         None,
                         None
                     )
                     )
-            if amnt < 0:
-                txn.postings.insert(0, data.Posting(
-                    ledger_asset,
-                    amount.Amount(amnt, asset),
-                    Cost(None, 'AUD', None, None),
-                    amount.Amount(price, 'AUD'),
-                    None,
-                    None
-                )
-                )
-                if txtype == "Sell":
-                    ledger_account = "Assets:Crypto:Cash"
-                else:
-                    ledger_account = "Income:Crypto:Market-Movement"
-                txn.postings.insert(0, data.Posting(
-                    ledger_account,
-                    amount.Amount(-cost, 'AUD'),
-                    None,
-                    None,
-                    None,
-                    None
-                )
-                )
-                txn.postings.insert(1, data.Posting(
-                    "Income:Crypto:Gains",
-                    amount.Amount(tax_gain * -1, 'AUD'),
-                    None,
-                    None,
-                    None,
-                    None
+                    ledger_account = "Assets:Crypto:Cash" if txtype == "Buy" else "Income:Crypto:Market-Movement"
+                    if txtype != "Earn":
+                        txn.postings.insert(0, data.Posting(
+                            ledger_account,
+                            amount.Amount(-cost, 'AUD'),
+                            None,
+                            None,
+                            None,
+                            None
+                        )
+                        )
+                if amnt < 0:
+                    txn.postings.insert(0, data.Posting(
+                        ledger_asset,
+                        amounts.amount(amnt, asset),
+                        Cost(None, 'AUD', None, None),
+                        amount.Amount(price, 'AUD'),
+                        None,
+                        None
                     )
                     )
-            if txtype == "Earn":
-                txn.postings.insert(1, data.Posting(
-                    "Income:Crypto:Income",
-                    amount.Amount(cost * -1, 'AUD'),
-                    None,
-                    None,
-                    None,
-                    None
+                    if txtype == "Sell":
+                        ledger_account = "Assets:Crypto:Cash"
+                    else:
+                        ledger_account = "Income:Crypto:Market-Movement"
+                    txn.postings.insert(0, data.Posting(
+                        ledger_account,
+                        amount.Amount(-cost, 'AUD'),
+                        None,
+                        None,
+                        None,
+                        None
                     )
                     )
-            entries.append(txn)
-        return entries
+                    txn.postings.insert(1, data.Posting(
+                        "Income:Crypto:Gains",
+                        amounts.amount(amounts.negate(tax_gain), 'AUD'),
+                        None,
+                        None,
+                        None,
+                        None
+                        )
+                        )
+                if txtype == "Earn":
+                    txn.postings.insert(1, data.Posting(
+                        "Income:Crypto:Income",
+                        amounts.amount(amounts.negate(cost), 'AUD'),
+                        None,
+                        None,
+                        None,
+                        None
+                        )
+                        )
+                emitted += 1
+                yield txn
+
+        # Time spent by the caller between entries is counted as build
+        recorder.add('rows', rows)
+        recorder.add('entries', emitted)
+        recorder.finish(rest='build')
+        return rows
@@ -1,6 +1,5 @@
 from beancount.core.number import D
 from beancount.ingest import importer
-from beancount.core import amount
 from beancount.core import flags
 from beancount.core import data
 
@@ -8,47 +7,72 @@ from datetime import date
 from dateutil.parser import parse
 
 from decimal import Decimal
-import csv
 import os
 import re
-import collections
+
+from .. import columns
+from .. import extract_cache
+from .. import stats
+from ..amounts import AmountCache
+from ..columns import Column
+from ..dates import DateParser
+
+# Ambiguous dates such as 1/7/2021 are read month first, as dateutil does
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y')
+
+# Any number of AccountN/AmountN column pairs make up the legs of a row
+LEG_COLUMN = re.compile(r'Account(\d+)$')
+
+ZERO = D('0')
+CENTS = Decimal(10) ** -2
 
 # Credits to https://gist.github.com/mterwill/7fdcc573dc1aa158648aacd4e33786e8#file-importers-chase-py
 
 class CSVImporter(importer.ImporterProtocol):
+    def __init__(self, file_encoding='utf-8-sig'):
+        self.file_encoding = file_encoding
+
     def identify(self, f):
         return re.match("c_.*\.csv", os.path.basename(f.name))
 
+    # Blank dates are today's date, so the cached entries are only reused on the same day
+    @extract_cache.cached(daily=True)
     def extract(self, f):
-        entries = []
-
-        with open(f.name) as f:
-            for index, row in enumerate(csv.DictReader(f)):
-                trans_date = parse(row["Date"]).date() if row["Date"] != "" else date.today()
-                flag= row["Flag"]
-                payee = row["Payee"]
-                desc = row["Description"]
-                
-                tags = row["Tags"].lower()
-                tags = tuple(tags.split(","))    
-
-                p_dict = collections.defaultdict(list)
-                for k, v in (
-                    (row["Account1"], row["Amount1"] if row["Amount1"] else 0),
-                    (row["Account2"], row["Amount2"] if row["Amount2"] else 0),
-                    (row["Account3"], row["Amount3"] if row["Amount3"] else 0),
-                    (row["Account4"], row["Amount4"] if row["Amount4"] else 0)
-                    ):
-                    p_dict[k].append(v)
-
-                values = list(p_dict.values())
-                check_values = sum(sum(map(Decimal, x)) for x in values)
-
-                empty_accounts = sum(1 for i in p_dict.keys() if i == "")
-                
-                if check_values != 0:
-                    pro_rata = D(-check_values/empty_accounts)
-                    pro_rata = pro_rata.quantize(Decimal(10) ** -2).normalize()
+        return list(self.iter_extract(f))
+
+    def iter_extract(self, f):
+        # Yield entries one row at a time so large exports run in constant memory
+
+        # The date format is detected from the first rows, anything else falls back to dateutil
+        # Blank dates are today's date
+        parse_date = DateParser(DATE_FORMATS, fallback=lambda text: parse(text).date() if text else date.today())
+        amounts = AmountCache()
+        recorder = stats.recorder(self, f.name)
+        emitted = 0
+
+        # Blank amounts are None, so they can't be mistaken for a 0 in the file
+        def number(text):
+            return amounts.number(text) if text else None
+
+        names = ("Date", "Flag", "Payee", "Description", "Tags")
+        legs = leg_columns(columns.read_header(f.name, self.file_encoding))
+        plan = [Column(name, parse_date if name == "Date" else None) for name in names]
+        for account, amnt in legs:
+            plan += [Column(account), Column(amnt, number, None)]
+        batches = columns.read_file(f.name, plan, self.file_encoding)
+
+        for batch in recorder.timed(batches, 'read'):
+            recorder.add('rows', len(batch))
+            accounts = [batch[account] for account, amnt in legs]
+            numbers = [batch[amnt] for account, amnt in legs]
+            shares = balancing_shares(accounts, numbers, len(batch))
+
+            rows = zip(batch.rows(*names), zip(*accounts), zip(*numbers), shares)
+            for index, (values, row_accounts, row_numbers, share) in enumerate(rows, batch.start):
+                trans_date, flag, payee, desc, tags = values
+
+                tags = tags.lower()
+                tags = tuple(tags.split(","))
 
                 meta = data.new_metadata(f.name, index)
 
@@ -62,16 +86,68 @@ class CSVImporter(importer.ImporterProtocol):
                     links=set(),
                     postings=[],
                 )
-                
-                for key, values in p_dict.items():
+
+                # Legs without an account are skipped, blank amounts take their share of the balance
+                blank = 0
+                for key, value in zip(row_accounts, row_numbers):
                     if key:
-                        if(isinstance(values, list)):
-                            for value in values: 
-                                txn.postings.append(
-                                    data.Posting(key, amount.Amount(D(value) if value else pro_rata,
-                                        "AUD"), None, None, None, None)
-                                )
+                        if value is None:
+                            blank += 1
+                            value = share[0] if blank < share[2] else share[1]
+                        txn.postings.append(
+                            data.Posting(key, amounts.amount(value, "AUD"), None, None, None, None))
+
+                # Postings to the same account are kept together, in the order the accounts first appear
+                keys = [key for key in row_accounts if key]
+                if len(set(keys)) < len(keys):
+                    first = {}
+                    for posting in txn.postings:
+                        first.setdefault(posting.account, len(first))
+                    txn.postings.sort(key=lambda posting: first[posting.account])
+
+                emitted += 1
+                yield txn
+
+        # Time spent by the caller between entries is counted as build
+        recorder.add('entries', emitted)
+        recorder.finish(rest='build')
+
+
+def leg_columns(header):
+    # Return the (AccountN, AmountN) column names of the header, ordered by N
+    # A leg without its AmountN column has blank amounts
+    legs = sorted(int(match.group(1)) for match in map(LEG_COLUMN.match, header) if match)
+    return [("Account{}".format(leg), "Amount{}".format(leg)) for leg in legs]
+
+
+def balancing_shares(accounts, numbers, size):
+    # Return (share, last share, legs) for each row of a batch, from its columns of
+    # leg accounts and amounts. The legs with an account and a blank amount balance
+    # the row: each gets -total / legs rounded to cents, the last one also takes the
+    # rounding remainder
+    totals = [ZERO] * size
+    blanks = [0] * size
+    for row_accounts, row_numbers in zip(accounts, numbers):
+        for index, value in enumerate(row_numbers):
+            if value is not None:
+                totals[index] += value
+            elif row_accounts[index]:
+                blanks[index] += 1
+
+    # Rows repeat the same few totals, so each (total, legs) is split once
+    shares = {}
+    result = []
+    for key in zip(totals, blanks):
+        share = shares.get(key)
+        if share is None:
+            share = shares[key] = _split(*key)
+        result.append(share)
+    return result
 
-                entries.append(txn)
 
-        return entries
+def _split(total, legs):
+    if not legs or not total:
+        return ZERO, ZERO, legs
+    share = (-total / legs).quantize(CENTS)
+    last = (-total).quantize(CENTS) - share * (legs - 1)
+    return share.normalize(), last.normalize(), legs
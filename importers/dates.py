@@ -0,0 +1,103 @@
+from datetime import date, datetime
+from itertools import islice
+
+# Number of values used to detect a file's date format
+SAMPLE_SIZE = 50
+
+
+def _ymd(text):
+    year, month, day = text.split('-')
+    if len(year) != 4:
+        raise ValueError(text)
+    return date(int(year), int(month), int(day))
+
+
+def _dmy(text):
+    day, month, year = text.split('/')
+    if len(year) != 4:
+        raise ValueError(text)
+    return date(int(year), int(month), int(day))
+
+
+def _mdy(text):
+    month, day, year = text.split('/')
+    if len(year) != 4:
+        raise ValueError(text)
+    return date(int(year), int(month), int(day))
+
+
+# Slicing parsers for the formats our exports use, anything else goes through strptime
+FAST_PARSERS = {
+    '%Y-%m-%d': _ymd,
+    '%d/%m/%Y': _dmy,
+    '%m/%d/%Y': _mdy,
+}
+
+
+def parser_for(fmt):
+    fast = FAST_PARSERS.get(fmt)
+    if fast is not None:
+        return fast
+
+    def parse(text):
+        return datetime.strptime(text, fmt).date()
+    return parse
+
+
+class DateParser:
+    """Parse the dates of one file, trying its detected format first and memoizing results.
+
+    formats are tried in order, so list the preferred format first for ambiguous dates.
+    fallback is called for values none of the formats accept.
+    """
+
+    def __init__(self, formats, fallback=None):
+        self.formats = list(formats)
+        self.fallback = fallback
+        self._parsers = [parser_for(fmt) for fmt in self.formats]
+        self._memo = {}
+
+    def detect(self, values):
+        # Move the format that parses the most sampled values to the front
+        # Ties keep the order given in formats
+        sample = list(islice(filter(None, values), SAMPLE_SIZE))
+        if not sample:
+            return self.formats[0]
+
+        def parsed(fmt):
+            parse = parser_for(fmt)
+            count = 0
+            for value in sample:
+                try:
+                    parse(value)
+                    count += 1
+                except ValueError:
+                    pass
+            return count
+
+        best = max(self.formats, key=parsed)
+        self.formats.remove(best)
+        self.formats.insert(0, best)
+        self._parsers = [parser_for(fmt) for fmt in self.formats]
+        self._memo.clear()
+        return best
+
+    def __call__(self, text):
+        try:
+            return self._memo[text]
+        except KeyError:
+            pass
+
+        for parse in self._parsers:
+            try:
+                value = parse(text)
+                break
+            except ValueError:
+                pass
+        else:
+            if self.fallback is None:
+                raise ValueError('no valid date format found')
+            value = self.fallback(text)
+
+        self._memo[text] = value
+        return value
@@ -0,0 +1,76 @@
+from beancount.core import data
+
+from beangulp.extract import DUPLICATE
+
+
+def normalize(text):
+    # Case and whitespace insensitive payee/narration
+    return ' '.join(text.lower().split()) if text else ''
+
+
+class DuplicateIndex:
+    """Hash index of existing transactions keyed by date, account, amount and payee/narration."""
+
+    def __init__(self, existing, dates=None):
+        # Only transactions on dates are indexed when given, as no other can match
+        self.keys = {}
+        self._texts = {}
+
+        keys = self.keys
+        text_for = self._text
+        Transaction = data.Transaction
+        for entry in existing:
+            if type(entry) is not Transaction:
+                continue
+            date = entry.date
+            if dates is not None and date not in dates:
+                continue
+            text = text_for(entry)
+            for posting in entry.postings:
+                units = posting.units
+                if units is None or units.number is None:
+                    continue
+                key = (date, posting.account, units.number, units.currency, text)
+                if key not in keys:
+                    keys[key] = entry
+
+    def _text(self, entry):
+        text = entry.payee or entry.narration
+        try:
+            return self._texts[text]
+        except KeyError:
+            normalized = self._texts[text] = normalize(text)
+            return normalized
+
+    def keys_for(self, entry):
+        text = self._text(entry)
+        for posting in entry.postings:
+            units = posting.units
+            if units is None or units.number is None:
+                continue
+            yield (entry.date, posting.account, units.number, units.currency, text)
+
+    def find(self, entry):
+        # Return the existing transaction entry duplicates, or None
+        for key in self.keys_for(entry):
+            target = self.keys.get(key)
+            if target is not None:
+                return target
+        return None
+
+
+def mark_duplicates(entries, existing):
+    # Mark extracted transactions that are already in the existing ledger
+    # The matching existing entry is stored in the "__duplicate__" metadata field
+    # The index is built for each call from the existing transactions on the dates of
+    # entries, so it holds no state between files and doesn't depend on their order
+    if not existing:
+        return
+    transactions = [entry for entry in entries if isinstance(entry, data.Transaction)]
+    if not transactions:
+        return
+    index = DuplicateIndex(existing, {entry.date for entry in transactions})
+    for entry in transactions:
+        target = index.find(entry)
+        if target is not None:
+            entry.meta[DUPLICATE] = target
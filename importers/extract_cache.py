@@ -0,0 +1,222 @@
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from datetime import date
+
+from . import mappings
+from . import stats
+
+# Extracted entries saved in SQLite so unchanged files are not extracted again
+#
+# Off unless IMPORTER_CACHE is set, to the path of the database or to 1 for
+# $LEDGER_DATA_DIR/import_cache.sqlite. The importers' extract methods are wrapped
+# with cached(), which looks up the file's entries under a key made of:
+#
+# - the SHA-256 of the file's contents
+# - the importer class and its settings (account, currency, file_encoding, ...)
+# - the SHA-256 of each mapping file the importer reads, so editing
+#   actual_budget_mappings.csv only invalidates the Actual Budget entries
+# - the SHA-256 of the importers package source
+# - today's date, for importers whose output depends on it
+#
+# One result is kept per file and importer, the importer named by its module, class and
+# settings, so two configured importers of the same file don't replace each other's
+# entries. The hashes of files are saved with their
+# mtime and size, so a warm run only stats the files and reads the entries back.
+
+ENV = 'IMPORTER_CACHE'
+LEDGER_DATA_DIR = os.environ.get('LEDGER_DATA_DIR', '/Ledger')
+DEFAULT_PATH = os.path.join(LEDGER_DATA_DIR, "import_cache.sqlite")
+
+# Bump when the format of the saved entries changes
+VERSION = 1
+
+CHUNK_SIZE = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, sha256 TEXT);
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT, importer TEXT, key TEXT, entries BLOB, PRIMARY KEY (path, importer));
+"""
+
+log = logging.getLogger(__name__)
+
+_path = os.environ.get(ENV) or None
+_source_hash = None
+_lock = threading.Lock()
+
+
+def enable(path=None):
+    global _path
+    _path = path or DEFAULT_PATH
+
+
+def disable():
+    global _path
+    _path = None
+
+
+def cache_path():
+    if _path == '1':
+        return DEFAULT_PATH
+    return _path
+
+
+def _hash_file(filepath):
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_hash():
+    # Hash of the importers package, so changing an importer invalidates its entries
+    global _source_hash
+    if _source_hash is None:
+        h = hashlib.sha256()
+        package = os.path.dirname(os.path.abspath(__file__))
+        for dirpath, dirnames, filenames in os.walk(package):
+            dirnames[:] = sorted(name for name in dirnames if name != '__pycache__')
+            for name in sorted(filenames):
+                if name.endswith('.py'):
+                    filepath = os.path.join(dirpath, name)
+                    h.update(os.path.relpath(filepath, package).encode())
+                    h.update(_hash_file(filepath).encode())
+        _source_hash = h.hexdigest()
+    return _source_hash
+
+
+def settings(importer):
+    # The importer's plain settings, such as account, currency and file_encoding
+    return sorted(
+        (name, value) for name, value in vars(importer).items()
+        if isinstance(value, (str, int, float, bool, type(None))))
+
+
+def importer_name(importer):
+    # The importer's class with its module and its settings, the importer column of results
+    # actual_budget.Importer and ioof_super.Importer share a class name
+    cls = type(importer)
+    return repr(('{}.{}'.format(cls.__module__, cls.__qualname__), settings(importer)))
+
+
+class Cache:
+    """Extracted entries per file and importer, stored in SQLite."""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        try:
+            self.db.executescript(SCHEMA)
+        except sqlite3.Error:
+            self.db.close()
+            raise
+
+    def close(self):
+        self.db.close()
+
+    def file_hash(self, filepath):
+        # SHA-256 of the file, reused while its mtime and size are unchanged
+        filepath = os.path.abspath(filepath)
+        st = os.stat(filepath)
+        row = self.db.execute(
+            "SELECT sha256 FROM hashes WHERE path = ? AND mtime_ns = ? AND size = ?",
+            (filepath, st.st_mtime_ns, st.st_size)).fetchone()
+        if row is not None:
+            return row[0]
+        sha256 = _hash_file(filepath)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)",
+                            (filepath, st.st_mtime_ns, st.st_size, sha256))
+        return sha256
+
+    def mapping_hash(self, filename, data_dir):
+        # Hash of the mapping file found the way mappings.load finds it, None if there is none
+        st, filepath = mappings.find(filename, data_dir)
+        if st is None:
+            return None
+        return self.file_hash(filepath)
+
+    def key(self, importer, filepath, mapping_files=(), daily=False):
+        parts = [
+            VERSION,
+            source_hash(),
+            self.file_hash(filepath),
+            importer_name(importer),
+            [(filename, self.mapping_hash(filename, data_dir)) for filename, data_dir in mapping_files],
+            date.today().isoformat() if daily else None,
+        ]
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def get(self, importer, filepath, key):
+        row = self.db.execute(
+            "SELECT key, entries FROM results WHERE path = ? AND importer = ?",
+            (os.path.abspath(filepath), importer_name(importer))).fetchone()
+        if row is None or row[0] != key:
+            return None
+        return pickle.loads(row[1])
+
+    def put(self, importer, filepath, key, entries):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (os.path.abspath(filepath), importer_name(importer), key,
+                 pickle.dumps(entries, pickle.HIGHEST_PROTOCOL)))
+
+
+def cached(mapping_files=None, daily=False, skip=None):
+    # Decorate an importer's extract to reuse the entries saved for an unchanged file
+    # mapping_files(importer) returns the (filename, data_dir) pairs of the mapping files
+    # it reads, called for every extract so the directories are the current ones,
+    # daily is for importers whose entries depend on today's date and
+    # skip(importer) is true when the entries depend on more than the key,
+    # such as incremental runs or the existing ledger
+    def decorator(extract):
+        @functools.wraps(extract)
+        def wrapper(importer, file_, *args, **kwargs):
+            path = cache_path()
+            if path is None or (skip is not None and skip(importer)):
+                return extract(importer, file_, *args, **kwargs)
+
+            # The legacy importers get a file object, the beangulp ones a path
+            filepath = getattr(file_, 'name', file_)
+            try:
+                with _lock:
+                    cache = Cache(path)
+            except sqlite3.Error as exc:
+                log.warning("import cache %s is unavailable: %s", path, exc)
+                return extract(importer, file_, *args, **kwargs)
+
+            try:
+                try:
+                    with _lock:
+                        files = mapping_files(importer) if mapping_files is not None else ()
+                        key = cache.key(importer, filepath, files, daily)
+                        entries = cache.get(importer, filepath, key)
+                except (OSError, sqlite3.Error, pickle.UnpicklingError) as exc:
+                    log.warning("import cache %s is unavailable: %s", path, exc)
+                    return extract(importer, file_, *args, **kwargs)
+
+                if entries is not None:
+                    recorder = stats.recorder(importer, filepath)
+                    recorder.add('entries', len(entries))
+                    recorder.finish('cache')
+                    return entries
+
+                entries = extract(importer, file_, *args, **kwargs)
+                try:
+                    with _lock:
+                        cache.put(importer, filepath, key, entries)
+                except (sqlite3.Error, pickle.PicklingError) as exc:
+                    log.warning("could not save %s to the import cache: %s", filepath, exc)
+                return entries
+            finally:
+                cache.close()
+        return wrapper
+    return decorator
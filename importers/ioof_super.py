@@ -7,77 +7,166 @@ from beancount.core import flags
 from beancount.core import data
 
 import beangulp
-from beangulp import mimetypes
-from beangulp.testing import main
 
 import csv
+import logging
 import os
 import re
-from datetime import datetime
+from collections import namedtuple
 from itertools import chain, groupby
 from operator import itemgetter
 
+from . import checkpoints
+from . import chunks
+from . import columns
+from . import dedup
+from . import extract_cache
+from . import mappings
+from . import registry
+from . import stats
+from .amounts import AmountCache
+from .columns import Column
+from .dates import DateParser
+
 LEDGER_DATA_DIR = os.environ.get('LEDGER_DATA_DIR', '/Ledger')
 BEAN_DATA_DIR = os.path.join(LEDGER_DATA_DIR, "mappings")
 CSV_HEADER = ["Date", "Type", "Description", "Unit price", "Units", "Amount"]
+DATE_FORMATS = ('%d/%m/%Y',)
+MAP_FILE = "ioof_transactions_mappings.csv"
+CHECKPOINTS = os.path.join(LEDGER_DATA_DIR, "import_checkpoints.json")
+MAP_HEADER = "trans_type,account_1,account_1_value,account_2,account_2_value,asset_name_2,asset_code_2"
+
+# Places kept in the unit cost and price of aggregated buys and sells
+AGGREGATE_QUANTUM = D('1E-10')
+
+log = logging.getLogger(__name__)
+
+# One compiled row of ioof_transactions_mappings.csv, the multipliers are ints
+TransactionMapping = namedtuple('TransactionMapping', [
+    'account_1', 'account_1_value', 'account_2', 'account_2_value',
+    'asset_name_2', 'asset_code_2'])
+
+
+def parse_transaction_map(filepath):
+    # CSV should contain the columns in MAP_HEADER
+    # 1st Column (trans_type) will be the key
+    # A malformed row is skipped with a warning, its type then gets the placeholder mapping
+    with open(filepath, encoding='utf-8-sig') as f:
+        header = f.readline().strip()
+        if not re.match(header, MAP_HEADER):
+            return False
+        table = {}
+        for line, rows in enumerate(csv.reader(f), 2):
+            try:
+                table[rows[0]] = TransactionMapping(rows[1], int(rows[2]), rows[3], int(rows[4]),
+                                                    rows[5], rows[6])
+            except (IndexError, ValueError) as exc:
+                log.warning("%s:%d: skipping malformed mapping row %r: %s", filepath, line, rows, exc)
+        return table
+
+
+class MappingResolver:
+    """Resolve transaction types to compiled mappings, reporting each unmapped type once."""
+
+    def __init__(self, table):
+        self.table = dict(table) if table else {}
+
+    def resolve(self, trans_type):
+        try:
+            return self.table[trans_type]
+        except KeyError:
+            # Post both legs to a placeholder account so the entry still shows up for review
+            log.warning("no account mappings specified for %r", trans_type)
+            account = "no account mappings specified for {!r}".format(trans_type)
+            mapping = TransactionMapping(account, 1, account, -1, None, None)
+            self.table[trans_type] = mapping
+            return mapping
+
 
 class Importer(beangulp.Importer):
-    def __init__(self, account, file_encoding='utf-8-sig'):
+    header_signature = registry.IOOF_SUPER
+
+    def __init__(self, account, file_encoding='utf-8-sig', incremental=False, jobs=1, aggregate=False):
         self.importer_account = account
         self.file_encoding = file_encoding
+        # Only extract rows added since the last run, see importers/checkpoints.py
+        # Every extract advances the checkpoint, so use it from bean-extract rather than fava
+        self.incremental = incremental
+        # Parse large files in up to jobs processes, see importers/chunks.py
+        self.jobs = jobs
+        # Merge the buys and sells of an asset on the same day into one transaction, see aggregate()
+        # Not with incremental, the checkpoint's last day is read again and would merge into other totals
+        if aggregate and incremental:
+            raise ValueError('aggregate=True cannot be combined with incremental=True')
+        self.aggregate = aggregate
 
     def identify(self, filepath):
-        with open(filepath, encoding=self.file_encoding) as f:
-            header = f.readline().strip().split(',')
-        return header == CSV_HEADER
+        return registry.matches(self.header_signature, filepath, self.file_encoding)
 
     def account(self, filepath):
         """Return the account against which we post transactions."""
         return self.importer_account
 
     def get_mappings(self):
-        # Get account mapping for Budget accounts --> Ledger accounts
-        # CSV should contain three columns "Budget Account, Ledger Account, Off-Budget"
-        # 1nd Column (Budget Acount) will be the key
-        try:
-            # found_csv = os.path.exists('ioof_transactions_mapping.csv')
-            # csv_path = BEAN_DATA_DIR + "/" if not found_csv else ""
-            with open(BEAN_DATA_DIR + '/ioof_transactions_mappings.csv', encoding='utf-8-sig') as f:
-                header = f.readline().strip()
-                if re.match(header, "trans_type,account_1,account_1_value,account_2,account_2_value,asset_name_2,asset_code_2"):
-                    reader = csv.reader(f)
-                    account_map = {
-                        rows[0]: {'account_1': rows[1], 'account_1_value': rows[2],
-                                  'account_2': rows[3], 'account_2_value': rows[4],
-                                  'asset_name_2': rows[5], 'asset_code_2': rows[6]} for rows in reader
-                        }
-            return account_map
-        except:
-            return False
+        # Get the compiled transaction type --> ledger account mappings
+        # The parsed table is cached and only reloaded when the mapping file changes
+        return mappings.load(MAP_FILE, BEAN_DATA_DIR, parse_transaction_map)
 
-    def get_map(self, trans_type, key):
-        try:
-            mappings = self.get_mappings()
-            account = mappings[trans_type][key]
-            return account
-        except KeyError as e:
-            return "no account mappings specified for {}".format(str(e))
+    def checkpoint_key(self):
+        # One checkpoint per importer account as re-downloaded exports usually get a new name
+        return "{}:{}".format(self.name, self.importer_account)
+
+    def columns(self, amounts):
+        # Dates stay as text for the checkpoints, parse_date memoizes them in iter_extract
+        return tuple(Column(name, amounts.number if name == "Amount" else None) for name in CSV_HEADER)
+
+    def read_batches(self, filepath, amounts, start=0, end=None):
+        return columns.read_range(filepath, self.columns(amounts), self.file_encoding, start, end)
 
+    def deduplicate(self, entries, existing):
+        # Mark entries already in the ledger through a hash index instead of pairwise comparison
+        dedup.mark_duplicates(entries, existing)
+
+    # Incremental runs depend on the checkpoint and are never cached
+    @extract_cache.cached(lambda self: [(MAP_FILE, BEAN_DATA_DIR)], skip=lambda self: self.incremental)
     def extract(self, filepath, existing):
-        # Create entries
-        # Create transaction entries
-        entries = []
-        
-        with open(filepath, mode='r', encoding=self.file_encoding) as f:
-            for index, row in enumerate(csv.DictReader(f)):
-                parsed_date = datetime.strptime(row["Date"], '%d/%m/%Y').date()
-                trans_type = row["Type"]
-                desc = row["Description"]
-                unit_price = row["Unit price"]
-                units = row["Units"]
-                amnt = row["Amount"]
-
-                meta = data.new_metadata(f.name, index)
+        if self.jobs > 1 and not self.incremental:
+            entries = chunks.extract(self, filepath, self.jobs)
+        else:
+            entries = list(self.iter_extract(filepath))
+        if self.aggregate:
+            entries = aggregate(entries)
+        return entries
+
+    def iter_extract(self, filepath, existing=None, start=0, end=None):
+        # Yield entries one row at a time so large exports run in constant memory
+        # start and end limit the rows to a byte range and the number of rows read is returned
+        recorder = stats.recorder(self, filepath)
+        resolver = MappingResolver(self.get_mappings())
+        recorder.lap('mappings')
+        parse_date = DateParser(DATE_FORMATS)
+        amounts = AmountCache()
+        rows = 0
+        emitted = 0
+
+        if self.incremental:
+            # Skip the rows before the checkpoint if the file still starts with them
+            store = checkpoints.Store(CHECKPOINTS)
+            start, first_row = checkpoints.resume(filepath, store.get(self.checkpoint_key()))
+            header, records = checkpoints.read_records(filepath, self.file_encoding, start)
+            plan = columns.ColumnPlan(header, self.columns(amounts))
+            batches = [plan.batch([record for record, end in records])]
+        else:
+            first_row = 0
+            batches = self.read_batches(filepath, amounts, start, end)
+
+        for batch in recorder.timed(batches, 'read'):
+            rows += len(batch)
+            batch_rows = enumerate(batch.rows(*CSV_HEADER), first_row + batch.start)
+            for index, (date, trans_type, desc, unit_price, units, amnt) in batch_rows:
+                parsed_date = parse_date(date)
+
+                meta = data.new_metadata(filepath, index)
 
                 txn = data.Transaction(
                     meta=meta,
@@ -91,49 +180,41 @@ class Importer(beangulp.Importer):
                 )
 
                 if not "pending" in trans_type:
-                    if not trans_type in ("Buys","Sells"):
-                        account_1 = self.get_map(trans_type, 'account_1')
-                        account_2 = self.get_map(trans_type, 'account_2')
-                        ttype = trans_type
-                    else:
-                        account_1 = self.get_map(desc, 'account_1')
-                        account_2 = self.get_map(desc, 'account_2')    
-                        ttype = desc            
-
-                    if not "no account" in account_1 or not "no account" in account_2:
-                        amount_1 = D(amnt) * int(self.get_map(ttype, 'account_1_value'))
-                        amount_2 = D(amnt) * int(self.get_map(ttype, 'account_2_value'))
-                    else:
-                        amount_1 = D(amnt)
-                        amount_2 = D(amnt) * -1
-
-                    asset_name = self.get_map(ttype, 'asset_name_2')
-                    asset_code = self.get_map(ttype, 'asset_code_2')
+                    ttype = trans_type if not trans_type in ("Buys","Sells") else desc
+                    mapping = resolver.resolve(ttype)
+
+                    account_1 = mapping.account_1
+                    account_2 = mapping.account_2
+                    amount_1 = amounts.scale(amnt, mapping.account_1_value)
+                    amount_2 = amounts.scale(amnt, mapping.account_2_value)
+
+                    asset_name = mapping.asset_name_2
+                    asset_code = mapping.asset_code_2
 
                     cur_2 = 'AUD'
                     cost_2 = None
                     price_2 = None
 
                     if asset_name == desc and trans_type == "Buys":
-                        amount_2 = D(units)
+                        amount_2 = amounts.number(units)
                         cur_2 = asset_code
-                        cost_2 = Cost(D(unit_price), 'AUD', None, None)
+                        cost_2 = Cost(amounts.number(unit_price), 'AUD', None, None)
 
                     if asset_name == desc and trans_type == "Sells":
-                        amount_2 = D(units)
+                        amount_2 = amounts.number(units)
                         cur_2 = asset_code
                         cost_2 = Cost(None, 'AUD', None, None)
-                        price_2 = amount.Amount(D(unit_price), 'AUD')
+                        price_2 = amounts.amount(amounts.number(unit_price), 'AUD')
 
                     index_1 = 0 if amount_1 >= 0 else 1
                     index_2 = 1 if index_1 == 0 else 0
 
                     txn.postings.insert(index_1,
-                        data.Posting(account_1, amount.Amount(D(amount_1),
+                        data.Posting(account_1, amounts.amount(amount_1,
                             'AUD'), None, None, None, None)
                     )
                     txn.postings.insert(index_2,
-                        data.Posting(account_2, amount.Amount(D(amount_2),
+                        data.Posting(account_2, amounts.amount(amount_2,
                             cur_2), cost_2, price_2, None, None)
                     )
                     if trans_type == "Sells":
@@ -141,7 +222,97 @@ class Importer(beangulp.Importer):
                         data.Posting("Income:Super:Gains", None, None, None, None, None)
                         )
 
-                    entries.append(txn)
+                    emitted += 1
+                    yield txn
 
-        return entries
+        if self.incremental:
+            checkpoint = checkpoints.checkpoint_for(
+                filepath, start, first_row, records, batches[0]["Date"])
+            if checkpoint:
+                store.set(self.checkpoint_key(), checkpoint)
+
+        # Time spent by the caller between entries is counted as build
+        recorder.add('rows', rows)
+        recorder.add('entries', emitted)
+        recorder.finish(rest='build')
+        return rows
+
+
+def _asset_posting(txn):
+    # The posting of units held at cost, None for entries without one
+    for position, posting in enumerate(txn.postings):
+        if posting.cost is not None:
+            return position, posting
+    return None, None
+
+
+def _merge(legs):
+    # Merge the buys or sells in legs into one transaction, or return None if they can't be
+    # The cash postings and units are summed. Buys are held at the cash paid per unit, the
+    # unit prices weighted by units up to the cents each row was rounded to, so the merged
+    # transaction balances. Sells keep the unit prices weighted by units as their price
+    first = legs[0]
+    position, asset = _asset_posting(first)
+    units = sum(_asset_posting(txn)[1].units.number for txn in legs)
+    cash = {}
+    for txn in legs:
+        for index, posting in enumerate(txn.postings):
+            if index != position and posting.units is not None:
+                cash[index] = cash.get(index, 0) + posting.units.number
+    if not units or len(cash) != 1:
+        return None
+
+    if asset.cost.number is not None:
+        cost = (-sum(cash.values()) / units).quantize(AGGREGATE_QUANTUM).normalize()
+        if cost <= 0:
+            return None
+        asset = asset._replace(units=amount.Amount(units, asset.units.currency), cost=asset.cost._replace(number=cost))
+    else:
+        weighted = sum(_asset_posting(txn)[1].units.number * txn.postings[position].price.number for txn in legs)
+        price = (weighted / units).quantize(AGGREGATE_QUANTUM).normalize()
+        asset = asset._replace(units=amount.Amount(units, asset.units.currency),
+                               price=amount.Amount(price, asset.price.currency))
+
+    postings = list(first.postings)
+    postings[position] = asset
+    for index, number in cash.items():
+        postings[index] = postings[index]._replace(units=amount.Amount(number, postings[index].units.currency))
+
+    # Each leg's row, units, unit price and cash amount are kept for the audit trail
+    meta = dict(first.meta)
+    meta['legs'] = D(len(legs))
+    for number, txn in enumerate(legs, 1):
+        leg = txn.postings[position]
+        unit_price = leg.cost.number if leg.cost.number is not None else leg.price.number
+        cash_leg = next(posting for index, posting in enumerate(txn.postings) if index in cash)
+        meta['leg{}'.format(number)] = 'row {}: {} {} at {} AUD for {}'.format(
+            txn.meta['lineno'], leg.units.number, leg.units.currency, unit_price, cash_leg.units)
+    return first._replace(meta=meta, postings=postings)
+
+
+def aggregate(entries):
+    # Merge the buys and sells of the same day, type, asset and accounts into one transaction
+    # placed where the first of them was. Other entries are left as they are
+    groups = {}
+    order = []
+    for txn in entries:
+        position, asset = _asset_posting(txn)
+        if asset is None or txn.payee not in ("Buys", "Sells"):
+            order.append([txn])
+            continue
+        key = (txn.date, txn.payee, asset.units.currency,
+               tuple(posting.account for posting in txn.postings), position)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = []
+            order.append(group)
+        group.append(txn)
 
+    merged = []
+    for legs in order:
+        txn = _merge(legs) if len(legs) > 1 else None
+        if txn is None:
+            merged.extend(legs)
+        else:
+            merged.append(txn)
+    return merged
@@ -0,0 +1,117 @@
+import importlib
+import inspect
+import os
+import re
+import threading
+
+import beangulp
+from beangulp import cache
+from beangulp import utils
+
+from . import registry
+
+# Config entries that import their importer module only when a file needs it
+#
+# fava reloads the import config often and import.py runs it on every command,
+# so importing every importer module up front costs the same whether or not
+# the import directory holds any of their files. A LazyImporter names the
+# importer class by its module path and holds its constructor arguments, and
+# identifies files by a header signature (see registry.py) or a file name
+# pattern without importing anything. The module is imported and the importer
+# built the first time a file is identified or extracted. Entries with
+# database=True also identify Actual Budget's db.sqlite, see actual_db.py.
+#
+# Both beangulp importers and the legacy ImporterProtocol ones can be loaded,
+# the legacy ones are called with a file object as beangulp's Adapter does.
+
+
+class LazyImporter(beangulp.Importer):
+    """Importer that imports and builds the real importer on first use."""
+
+    def __init__(self, path, args=(), kwargs=None, signature=None, filename=None, database=False):
+        # path is the dotted path of the importer class, such as "importers.actual_budget.Importer"
+        # signature or filename (a regex matched against the file's name) identify files
+        # without loading the importer, with neither the importer's identify() is used
+        # database also identifies Actual's db.sqlite, for the Actual Budget importer
+        self.path = path
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.header_signature = signature
+        self.filename_pattern = re.compile(filename) if filename is not None else None
+        self.database = database
+        self._importer = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<LazyImporter {}>'.format(self.path)
+
+    @property
+    def name(self):
+        # Same as the default name of the importer, without loading it
+        return self.path
+
+    @property
+    def file_encoding(self):
+        # The encoding the importer reads the header with, see registry.matches
+        return self.kwargs.get('file_encoding', 'utf-8-sig')
+
+    @property
+    def loaded(self):
+        return self._importer is not None
+
+    @property
+    def importer(self):
+        # The real importer, imported and built the first time it is needed
+        if self._importer is None:
+            with self._lock:
+                if self._importer is None:
+                    module, name = self.path.rsplit('.', 1)
+                    cls = getattr(importlib.import_module(module), name)
+                    self._importer = cls(*self.args, **self.kwargs)
+        return self._importer
+
+    def _legacy(self):
+        return not isinstance(self.importer, beangulp.Importer)
+
+    def identify(self, filepath):
+        if self.database:
+            # Imported here so loading a config doesn't import sqlite3 and the database reader
+            from . import actual_db
+            if actual_db.is_database(filepath):
+                return True
+        if self.header_signature is not None:
+            # The importers match the header the same way, see registry.matches
+            return registry.matches(self.header_signature, filepath, self.file_encoding)
+        if self.filename_pattern is not None:
+            return self.filename_pattern.match(os.path.basename(filepath)) is not None
+        if self._legacy():
+            return self.importer.identify(cache.get_file(filepath))
+        return self.importer.identify(filepath)
+
+    def account(self, filepath):
+        if self._legacy():
+            return self.importer.file_account(cache.get_file(filepath))
+        return self.importer.account(filepath)
+
+    def date(self, filepath):
+        if self._legacy():
+            return self.importer.file_date(cache.get_file(filepath))
+        return self.importer.date(filepath)
+
+    def filename(self, filepath):
+        if self._legacy():
+            filename = self.importer.file_name(cache.get_file(filepath))
+            return utils.idify(filename) if filename else None
+        return self.importer.filename(filepath)
+
+    def extract(self, filepath, existing):
+        if self._legacy():
+            if len(inspect.signature(self.importer.extract).parameters) > 1:
+                return self.importer.extract(cache.get_file(filepath), existing)
+            return self.importer.extract(cache.get_file(filepath))
+        return self.importer.extract(filepath, existing)
+
+    def deduplicate(self, entries, existing):
+        if self._legacy():
+            return super().deduplicate(entries, existing)
+        return self.importer.deduplicate(entries, existing)
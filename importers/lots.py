@@ -0,0 +1,176 @@
+import heapq
+import logging
+from collections import defaultdict
+from itertools import count
+
+from beancount.core import amount
+from beancount.core import data
+from beancount.core.position import Cost
+
+log = logging.getLogger(__name__)
+
+# First in, first out lots for the CoinSpot importer
+#
+# Buys add a lot of units at their cost per unit, sells take units from the oldest
+# lots of the coin. Each coin's open lots are a heap ordered by date, so a sell costs
+# O(log n) for every lot it uses up. book() rewrites sells with one posting per lot
+# reduced, at the lot's cost and date, and fills in the gains, instead of leaving the
+# lot matching to beancount's booking.
+
+
+class LotIndex:
+    """Open lots per currency, reduced first in first out."""
+
+    def __init__(self):
+        self.lots = defaultdict(list)
+        self.units = defaultdict(int)
+        self._order = count()
+
+    def add(self, currency, date, units, cost):
+        # Lots are [date, order, units left, cost per unit], order keeps same day lots in sequence
+        heapq.heappush(self.lots[currency], [date, next(self._order), units, cost])
+        self.units[currency] += units
+
+    def available(self, currency):
+        return self.units[currency]
+
+    def reduce(self, currency, units):
+        # Take units from the oldest lots, returning [(units, cost per unit, lot date)]
+        # Callers check available() first
+        heap = self.lots[currency]
+        taken = []
+        remaining = units
+        while remaining > 0:
+            lot = heap[0]
+            if not lot[2]:
+                # An empty lot
+                heapq.heappop(heap)
+                continue
+            take = min(lot[2], remaining)
+            taken.append((take, lot[3], lot[0]))
+            lot[2] -= take
+            remaining -= take
+            if not lot[2]:
+                heapq.heappop(heap)
+        self.units[currency] -= units
+        return taken
+
+    def reduce_lot(self, currency, units, cost, date=None):
+        # Take units from the lots at cost per unit, and bought on date if given, oldest first
+        # This follows the lot a booked ledger reduced, units not found there are taken first in first out
+        # Lots are popped in date order until the units are found, the lots passed over and
+        # the rest of a lot partly taken are pushed back, so the heap is never sorted
+        heap = self.lots[currency]
+        skipped = []
+        remaining = units
+        while remaining > 0 and heap:
+            lot = heapq.heappop(heap)
+            if lot[2] and lot[3] == cost and (date is None or lot[0] == date):
+                take = min(lot[2], remaining)
+                lot[2] -= take
+                remaining -= take
+            if lot[2]:
+                skipped.append(lot)
+        for lot in skipped:
+            heapq.heappush(heap, lot)
+        self.units[currency] -= units - remaining
+        remaining = min(remaining, self.available(currency))
+        if remaining > 0:
+            self.reduce(currency, remaining)
+
+def _held(posting, prefix):
+    # Whether posting holds units at cost in an account under prefix
+    return posting.account.startswith(prefix) and posting.cost is not None and posting.units is not None
+
+
+def load(index, entries, prefix, before=None):
+    # Add the lots bought and reduce the lots sold in a booked ledger, up to the date before
+    # Sells reduce the lots the ledger booked them against, by their cost and lot date
+    for entry in sorted((entry for entry in entries if isinstance(entry, data.Transaction)),
+                        key=lambda entry: entry.date):
+        if before is not None and entry.date >= before:
+            break
+        for posting in entry.postings:
+            if not _held(posting, prefix):
+                continue
+            units = posting.units
+            if units.number > 0 and posting.cost.number is not None:
+                index.add(units.currency, posting.cost.date or entry.date, units.number, posting.cost.number)
+            elif units.number < 0:
+                number = min(-units.number, index.available(units.currency))
+                if number <= 0:
+                    continue
+                if posting.cost.number is not None:
+                    # The lot the ledger booked, which may not be the oldest
+                    index.reduce_lot(units.currency, number, posting.cost.number, posting.cost.date)
+                else:
+                    index.reduce(units.currency, number)
+
+
+def book(entries, prefix, gains_account, existing=None):
+    # Return entries with each sell reduced from the lots of the buys before it
+    # existing entries dated before the first entry seed the lots
+    # Buys of a day are booked before its sells, sells without enough units are left as they are
+    if not entries:
+        return entries
+    index = LotIndex()
+    if existing:
+        load(index, existing, prefix, min(entry.date for entry in entries))
+
+    order = []
+    for position, entry in enumerate(entries):
+        for posting in entry.postings:
+            if _held(posting, prefix):
+                sell = posting.units.number < 0
+                order.append((entry.date, sell, entry.meta.get('lineno', 0), position))
+                break
+    order.sort()
+
+    booked = list(entries)
+    for date, sell, lineno, position in order:
+        entry = entries[position]
+        if not sell:
+            for posting in entry.postings:
+                if _held(posting, prefix) and posting.cost.number is not None:
+                    units = posting.units
+                    index.add(units.currency, posting.cost.date or date, units.number, posting.cost.number)
+            continue
+
+        postings = []
+        reduced = False
+        for posting in entry.postings:
+            units = posting.units
+            if not _held(posting, prefix) or units.number > 0 or posting.cost.number is not None:
+                postings.append(posting)
+            elif index.available(units.currency) < -units.number:
+                log.warning("not enough %s lots to book the sell on %s", units.currency, date)
+                postings.append(posting)
+            else:
+                for taken, cost, lot_date in index.reduce(units.currency, -units.number):
+                    postings.append(data.Posting(
+                        posting.account, amount.Amount(-taken, units.currency),
+                        Cost(cost, posting.cost.currency, lot_date, None),
+                        posting.price, posting.flag, posting.meta))
+                reduced = True
+        if reduced:
+            booked[position] = entry._replace(postings=_fill_gains(postings, gains_account))
+    return booked
+
+
+def _fill_gains(postings, gains_account):
+    # The gains balance the cash received against the cost of the lots reduced
+    residual = 0
+    currency = None
+    for posting in postings:
+        if posting.account == gains_account and posting.units is None:
+            continue
+        if posting.cost is not None:
+            residual += posting.units.number * posting.cost.number
+            currency = posting.cost.currency
+        else:
+            residual += posting.units.number
+            currency = posting.units.currency
+    return [
+        posting._replace(units=amount.Amount(-residual, currency))
+        if posting.account == gains_account and posting.units is None else posting
+        for posting in postings]
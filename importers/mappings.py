@@ -0,0 +1,104 @@
+import csv
+import logging
+import os
+import re
+import threading
+from collections import namedtuple
+from itertools import chain
+from types import MappingProxyType
+
+# Parsed mapping tables keyed by (absolute path, parser)
+# Each value is ((st_mtime_ns, st_size), parsed table)
+_cache = {}
+_lock = threading.Lock()
+
+log = logging.getLogger(__name__)
+
+ACCOUNT_MAP_HEADER = "Budget Account,Ledger Account,Off-Budget"
+
+
+def find(filename, data_dir):
+    """Return the stat result and path of filename, preferring the working directory over data_dir."""
+    for candidate in (filename, os.path.join(data_dir, filename)):
+        try:
+            return os.stat(candidate), candidate
+        except OSError:
+            pass
+    return None, None
+
+
+def load(filename, data_dir, parser):
+    # Return parser(path) for the mapping file, reparsing only when its mtime or size changes
+    # Returns False if the mapping file cannot be found
+    st, filepath = find(filename, data_dir)
+    if st is None:
+        return False
+
+    key = (os.path.abspath(filepath), parser)
+    signature = (st.st_mtime_ns, st.st_size)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        try:
+            table = parser(filepath)
+        except Exception:
+            log.exception("could not read the mapping file %s", filepath)
+            table = False
+        _cache[key] = (signature, table)
+    return table
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+def parse_account_map(filepath):
+    # Get account mapping for Budget accounts --> Ledger accounts
+    # CSV should contain three columns "Budget Account, Ledger Account, Off-Budget"
+    # 1nd Column (Budget Acount) will be the key
+    with open(filepath) as f:
+        header = f.readline().strip()
+        if not re.match(header, ACCOUNT_MAP_HEADER):
+            return False
+        reader = csv.reader(f)
+        return {rows[0]: {'Ledger Account': rows[1], 'Off-Budget': rows[2]} for rows in reader}
+
+
+# The Actual Budget account map compiled for the cleaning rules
+# ledger maps budget names to ledger accounts, balance_sheet holds the budget names mapped to
+# Assets or Liabilities accounts and off_budget both names of the off-budget accounts.
+# no_category and loan_interest are the resolved fallback categories
+AccountTables = namedtuple('AccountTables', [
+    'ledger', 'balance_sheet', 'off_budget', 'no_category', 'loan_interest'])
+
+
+def compile_account_map(account_map):
+    account_map = account_map or {}
+    ledger = {name: values['Ledger Account'] for name, values in account_map.items()}
+    balance_sheet = frozenset(
+        name for name, account in ledger.items()
+        if account.split(':')[0] in ('Assets', 'Liabilities'))
+    off_budget = frozenset(chain.from_iterable(
+        (name, values['Ledger Account'])
+        for name, values in account_map.items()
+        if values['Off-Budget'] == 'Y'))
+    return AccountTables(
+        MappingProxyType(ledger),
+        balance_sheet,
+        off_budget,
+        ledger.get('No Category', 'No Category'),
+        ledger.get('Bank Loan Interest', 'Bank Loan Interest'),
+    )
+
+
+def parse_account_tables(filepath):
+    return compile_account_map(parse_account_map(filepath))
+
+
+NO_ACCOUNT_TABLES = compile_account_map({})
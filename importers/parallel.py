@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from beancount import loader
+
+from beangulp import exceptions
+from beangulp import extract
+from beangulp import identify
+from beangulp import utils
+
+from . import actual_db
+from . import registry
+from . import stats
+
+# Importers and existing entries used by the worker processes
+# With the fork start method they are inherited from the parent instead of pickled
+_importers = None
+_existing = None
+_router = None
+
+
+def _init(importers, existing):
+    global _importers, _existing, _router
+    _importers = importers
+    _existing = existing
+    _router = registry.Router(importers)
+
+
+def identify_file(router, filename):
+    # Same as beangulp's identify.identify, with the files routed by their header
+    match = router.identify(filename)
+    if len(match) > 1:
+        raise exceptions.Error('Document identified by more than one importer.',
+                               *['  {}'.format(importer.name) for importer in match])
+    return match[0] if match else None
+
+
+def preload(importers):
+    # Load the mapping tables in the parent so forked workers start with a warm cache
+    for importer in importers:
+        # beangulp wraps the legacy ImporterProtocol importers in an Adapter
+        importer = getattr(importer, 'importer', importer)
+        for name in ('get_account_map', 'get_account_tables', 'get_mappings'):
+            method = getattr(importer, name, None)
+            if method is not None:
+                method()
+
+
+def process(filename):
+    # Identify and extract one file
+    # Returns (filename, importer index, entries, account, error, stats records)
+    try:
+        importer = identify_file(_router, filename)
+        if not importer:
+            return filename, None, None, None, None, stats.collect()
+        entries = extract.extract_from_file(importer, filename, _existing)
+        account = importer.account(filename)
+        return filename, _importers.index(importer), entries, account, None, stats.collect()
+    except exceptions.Error as exc:
+        return filename, None, None, None, exc, stats.collect()
+    except Exception:
+        return filename, None, None, None, exceptions.Error(
+            'Exception in importer code.', traceback.format_exc().rstrip()), stats.collect()
+
+
+def _walk(file_or_dirs, log):
+    for filename in utils.walk(file_or_dirs):
+        # Actual's db.sqlite is usually larger than beangulp's limit for documents
+        if os.path.getsize(filename) > identify.FILE_TOO_LARGE_THRESHOLD and not actual_db.is_database(filename):
+            log(f'* {filename:} ... SKIP')
+            continue
+        yield filename
+
+
+@click.command('extract')
+@click.argument('src', nargs=-1, type=click.Path(exists=True, resolve_path=True))
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Output file.')
+@click.option('--existing', '-e', type=click.Path(exists=True),
+              help='Existing Beancount ledger for de-duplication.')
+@click.option('--reverse', '-r', is_flag=True,
+              help='Sort entries in reverse order.')
+@click.option('--failfast', '-x', is_flag=True,
+              help='Stop processing at the first error.')
+@click.option('--quiet', '-q', count=True,
+              help='Suppress all output.')
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=1,
+              help='Number of processes used to identify and extract files.')
+@click.option('--stats', 'show_stats', is_flag=True,
+              help='Print a table of time per extract stage and row counts for each file.')
+@click.pass_obj
+def extract_command(ctx, src, output, existing, reverse, failfast, quiet, jobs, show_stats):
+    """Extract transactions from documents.
+
+    Same as the beangulp extract command, but with --jobs N the files are
+    identified and extracted in a pool of N processes. Results are merged
+    back in the order the files were found, so the output is identical to
+    a serial run.
+
+    With --stats a table of the time spent in each extract stage, rows
+    read, rows excluded and entries emitted is printed to stderr. Set
+    IMPORTER_STATS=FILE to also get the records as JSON lines.
+
+    """
+    verbosity = -quiet
+    log = utils.logger(verbosity, err=True)
+    errors = exceptions.ExceptionsTrap(log)
+
+    # Load the ledger, if one is specified.
+    existing_entries = loader.load_file(existing)[0] if existing else []
+
+    filenames = list(_walk(src, log))
+    if show_stats:
+        stats.enable()
+    _init(ctx.importers, existing_entries)
+
+    if jobs > 1 and len(filenames) > 1:
+        preload(ctx.importers)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        executor = ProcessPoolExecutor(min(jobs, len(filenames)), mp_context=context,
+                                       initializer=_init, initargs=(ctx.importers, existing_entries))
+        results = executor.map(process, filenames)
+    else:
+        executor = None
+        results = map(process, filenames)
+
+    extracted = []
+    records = []
+    try:
+        for filename, index, entries, account, error, file_records in results:
+            records.extend(file_records)
+            log(f'* {filename:}', nl=False)
+            with errors:
+                if error is not None:
+                    raise error
+                if index is None:
+                    log('') # Newline.
+                    continue
+
+                # Signal processing of this document.
+                log(' ...', nl=False)
+                extracted.append((filename, entries, account, ctx.importers[index]))
+                log(' OK', fg='green')
+
+            if failfast and errors:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    # Sort.
+    extract.sort_extracted_entries(extracted)
+
+    # Deduplicate.
+    for filename, entries, account, importer in extracted:
+        importer.deduplicate(entries, existing_entries)
+        existing_entries.extend(entries)
+
+    # Invoke hooks.
+    for func in ctx.hooks:
+        extracted = func(extracted, existing_entries)
+
+    # Serialize entries.
+    extract.print_extracted_entries(extracted, output)
+
+    if show_stats and records:
+        click.echo(stats.format_table(records), err=True)
+
+    if errors:
+        sys.exit(1)
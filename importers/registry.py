@@ -0,0 +1,225 @@
+import codecs
+import os
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+# Importers declare the columns their CSV header must contain
+# exact=True requires the header to be exactly these columns in order
+# exact=False only requires every column to be present
+Signature = namedtuple('Signature', ['columns', 'exact'])
+
+# Signatures of the export formats, defined here so a config can route files
+# to importers without importing their modules, see importers/lazy.py
+ACTUAL_BUDGET = Signature(("Account", "Date", "Payee", "Notes", "Category", "Amount", "Cleared"), exact=False)
+IOOF_SUPER = Signature(("Date", "Type", "Description", "Unit price", "Units", "Amount"), exact=True)
+COINSPOT = Signature((
+    "Transaction Date", "Type", "Market", "Amount", "Rate inc. fee", "Rate ex. fee", "Fee",
+    "Fee AUD (inc GST)", "GST AUD", "Total AUD", "Total (inc GST)"), exact=True)
+CRYPTO = Signature((
+    "Id", "Wallet", "Transaction Date", "Type", "Subtype", "Asset", "Amount", "Costbase",
+    "Remarks", "Txid", "Realised.TAX_GAIN"), exact=True)
+
+# Files are screened from the first PREFIX_SIZE bytes before any decoding.
+# Files that are empty, have a binary extension, start with the magic bytes of
+# a binary format or have no complete first line in the prefix are rejected.
+# The header is then compared as bytes, with a UTF-8 BOM dropped, against the
+# signature encoded the same way, and a NUL byte in it means a binary file.
+# Encodings that aren't ASCII compatible, such as UTF-16, decode the header instead.
+PREFIX_SIZE = 8192
+
+BINARY_EXTENSIONS = frozenset((
+    '.pdf', '.zip', '.gz', '.bz2', '.xz', '.7z', '.tar', '.xls', '.xlsx', '.ods',
+    '.doc', '.docx', '.png', '.jpg', '.jpeg', '.gif', '.heic', '.webp'))
+
+MAGIC = (
+    b'%PDF',              # PDF
+    b'PK\x03\x04',        # zip, xlsx, docx, ods
+    b'\x1f\x8b',          # gzip
+    b'\xd0\xcf\x11\xe0',  # xls, doc
+    b'\x89PNG',           # PNG
+    b'\xff\xd8\xff',      # JPEG
+    b'GIF8',              # GIF
+    b'SQLite format 3\0',  # SQLite, such as Actual's db.sqlite
+)
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
+# Raw first line of each file keyed by absolute path
+# Each value is ((st_mtime_ns, st_size), header bytes without BOM and line ending, or None)
+_prefixes = {}
+_lock = threading.Lock()
+
+
+def normalize(line):
+    # Split a CSV header line into a tuple of bare column names
+    line = line.lstrip('\ufeff').strip()
+    return tuple(column.strip().strip('"') for column in line.split(','))
+
+
+def normalize_bytes(line):
+    # normalize() for the raw bytes of a header line
+    return tuple(column.strip().strip(b'"') for column in line.strip().split(b','))
+
+
+def _screen(filepath, size):
+    # Return the raw header line of filepath, or None if it can't be a CSV export
+    if not size or os.path.splitext(filepath)[1].lower() in BINARY_EXTENSIONS:
+        return None
+    try:
+        with open(filepath, 'rb') as f:
+            prefix = f.read(PREFIX_SIZE)
+    except OSError:
+        return None
+    if prefix.startswith(MAGIC):
+        return None
+    while prefix.startswith(UTF8_BOM):
+        prefix = prefix[len(UTF8_BOM):]
+    newline = prefix.find(b'\n')
+    if newline == -1:
+        if size > PREFIX_SIZE:
+            return None
+        newline = len(prefix)
+    return prefix[:newline].rstrip(b'\r')
+
+
+def read_prefix(filepath):
+    """Return the raw header line of filepath, or None if it was rejected or cannot be read."""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+
+    key = os.path.abspath(filepath)
+    signature = (st.st_mtime_ns, st.st_size)
+    cached = _prefixes.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    line = _screen(filepath, st.st_size)
+    with _lock:
+        _prefixes[key] = (signature, line)
+    return line
+
+
+@lru_cache(maxsize=None)
+def _byte_encoding(encoding):
+    # The codec used to compare headers as bytes, None if the encoding isn't ASCII compatible
+    # (such as UTF-16), the BOM is dropped from the prefix so utf-8-sig compares as utf-8
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        return None
+    if name == 'utf-8-sig':
+        return 'utf-8'
+    sample = 'Date,"Amount"\r\n'
+    try:
+        return name if sample.encode(name) == sample.encode('ascii') else None
+    except UnicodeError:
+        return None
+
+
+def read_header(filepath, encoding='utf-8-sig'):
+    """Return the normalized header columns of filepath, or None if it cannot be read."""
+    line = read_prefix(filepath)
+    if line is None:
+        return None
+    byte_encoding = _byte_encoding(encoding)
+    try:
+        if byte_encoding is None:
+            with open(filepath, encoding=encoding) as f:
+                return normalize(f.readline(PREFIX_SIZE))
+        if b'\0' in line:
+            return None
+        return normalize(line.decode(byte_encoding))
+    except (OSError, UnicodeError, LookupError):
+        return None
+
+
+def clear():
+    with _lock:
+        _prefixes.clear()
+    _matches.cache_clear()
+    _encoded.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def _matches(signature, columns):
+    if signature.exact:
+        return columns == signature.columns
+    return set(signature.columns).issubset(columns)
+
+
+@lru_cache(maxsize=None)
+def _encoded(signature, encoding):
+    # signature with its columns encoded, None if they can't be encoded
+    try:
+        return Signature(tuple(column.encode(encoding) for column in signature.columns), signature.exact)
+    except UnicodeError:
+        return None
+
+
+def matches(signature, filepath, encoding='utf-8-sig'):
+    """Return True if the header of filepath satisfies signature."""
+    line = read_prefix(filepath)
+    if line is None:
+        return False
+    byte_encoding = _byte_encoding(encoding)
+    if byte_encoding is None:
+        columns = read_header(filepath, encoding)
+        return columns is not None and _matches(signature, columns)
+    if b'\0' in line:
+        return False
+    encoded = _encoded(signature, byte_encoding)
+    return encoded is not None and _matches(encoded, normalize_bytes(line))
+
+
+
+def _routing(importer):
+    # The header signature and byte encoding importer is routed by, None if only its identify() can tell
+    # beangulp wraps the legacy importers in an Adapter, LazyImporter holds the signature itself
+    target = importer if hasattr(importer, 'header_signature') else getattr(importer, 'importer', None)
+    signature = getattr(target, 'header_signature', None)
+    if signature is None:
+        return None
+    encoding = _byte_encoding(getattr(target, 'file_encoding', 'utf-8-sig'))
+    if encoding is None:
+        return None
+    return _encoded(signature, encoding)
+
+
+class Router:
+    """Route files to importers through a hash lookup on their header line."""
+
+    def __init__(self, importers):
+        self.importers = list(importers)
+        self._signatures = [(importer, _routing(importer)) for importer in self.importers]
+        # Importers without a usable signature, such as custom_csv's file name match,
+        # are asked through identify() for every file
+        self.fallback = [importer for importer, signature in self._signatures if signature is None]
+        self._routes = {}
+
+    def route(self, line):
+        # The importers whose signature matches the raw header line, computed once per distinct header
+        routed = self._routes.get(line)
+        if routed is None:
+            columns = normalize_bytes(line) if b'\0' not in line else None
+            routed = [
+                importer for importer, signature in self._signatures
+                if signature is not None and columns is not None and _matches(signature, columns)]
+            self._routes[line] = routed
+        return routed
+
+    def identify(self, filepath):
+        # Return the importers that accept filepath, in config order
+        # Files rejected by the byte screen, such as Actual's db.sqlite, are offered to every
+        # importer's identify(). A header matching several signatures is settled by identify()
+        line = read_prefix(filepath)
+        if line is None:
+            return [importer for importer in self.importers if importer.identify(filepath)]
+        routed = self.route(line)
+        if len(routed) > 1:
+            routed = [importer for importer in routed if importer.identify(filepath)]
+        matched = set(routed)
+        matched.update(importer for importer in self.fallback if importer.identify(filepath))
+        return [importer for importer in self.importers if importer in matched]
@@ -0,0 +1,168 @@
+import json
+import os
+import sys
+from time import perf_counter
+
+# Per-stage timings and counters for the importers' extract
+#
+# Off unless IMPORTER_STATS is set or enable() is called (import.py extract --stats).
+# When it is off recorder() returns a shared no-op recorder, so an extract only pays
+# for a handful of method calls per file.
+#
+# IMPORTER_STATS=FILE appends one JSON object per extracted file to FILE, use - for stderr.
+# Each object has the importer, the file, the wall time of each stage in seconds and
+# the counters, such as rows read, rows excluded by reason, groups and entries.
+
+ENV = 'IMPORTER_STATS'
+
+_output = os.environ.get(ENV) or None
+_enabled = _output is not None
+_records = []
+
+
+def enable(output=None):
+    global _enabled, _output
+    _enabled = True
+    if output is not None:
+        _output = output
+
+
+def enabled():
+    return _enabled
+
+
+def collect():
+    # Return and clear the records of the files extracted so far
+    records = _records[:]
+    del _records[:]
+    return records
+
+
+def merge(records):
+    # Add records collected in worker processes, they were already written there
+    _records.extend(records)
+
+
+def _write(record):
+    line = json.dumps(record, sort_keys=True)
+    if _output == '-':
+        print(line, file=sys.stderr)
+    elif _output:
+        with open(_output, 'a') as f:
+            f.write(line + '\n')
+
+
+class Recorder:
+    """Timings and counters of one extract."""
+
+    enabled = True
+
+    def __init__(self, importer, filepath):
+        self.importer = '{}.{}'.format(type(importer).__module__, type(importer).__name__)
+        self.filepath = filepath
+        self.stages = {}
+        self.counters = {}
+        self.start = self.last = perf_counter()
+
+    def lap(self, name):
+        # Add the time since the previous lap, or the start, to the stage
+        now = perf_counter()
+        self.stages[name] = self.stages.get(name, 0) + now - self.last
+        self.last = now
+
+    def timed(self, iterable, name):
+        # Yield from iterable, timing each step as part of the stage
+        stages = self.stages
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                stages[name] = stages.get(name, 0) + perf_counter() - start
+                return
+            stages[name] = stages.get(name, 0) + perf_counter() - start
+            yield item
+
+    def add(self, name, count=1):
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def finish(self, rest=None):
+        # Record the extract, the time not spent in a stage is added to the stage named rest
+        total = perf_counter() - self.start
+        if rest is not None:
+            self.stages[rest] = self.stages.get(rest, 0) + max(total - sum(self.stages.values()), 0)
+        record = {
+            'importer': self.importer,
+            'file': self.filepath,
+            'total': total,
+            'stages': self.stages,
+            'counters': self.counters,
+        }
+        _records.append(record)
+        _write(record)
+        return record
+
+
+class NullRecorder:
+    """Recorder used while stats are off, every method does nothing."""
+
+    enabled = False
+
+    def lap(self, name):
+        pass
+
+    def timed(self, iterable, name):
+        return iterable
+
+    def add(self, name, count=1):
+        pass
+
+    def finish(self, rest=None):
+        pass
+
+
+NULL = NullRecorder()
+
+
+def recorder(importer, filepath):
+    if not _enabled:
+        return NULL
+    return Recorder(importer, filepath)
+
+
+def format_table(records):
+    # Summary table of stage times and counters, one line per file and a total line
+    stages = []
+    counters = []
+    for record in records:
+        stages.extend(name for name in record['stages'] if name not in stages)
+        counters.extend(name for name in record['counters'] if name not in counters)
+
+    header = ['file'] + stages + ['total'] + counters
+    lines = []
+    totals = {}
+    for record in records:
+        line = [os.path.basename(record['file'])]
+        for name in stages:
+            value = record['stages'].get(name, 0)
+            totals[name] = totals.get(name, 0) + value
+            line.append('{:.3f}'.format(value))
+        totals['total'] = totals.get('total', 0) + record['total']
+        line.append('{:.3f}'.format(record['total']))
+        for name in counters:
+            value = record['counters'].get(name, 0)
+            totals[name] = totals.get(name, 0) + value
+            line.append(str(value))
+        lines.append(line)
+    if len(records) > 1:
+        lines.append(['TOTAL'] + ['{:.3f}'.format(totals[name]) for name in stages + ['total']]
+                     + [str(totals[name]) for name in counters])
+
+    widths = [max(len(row[index]) for row in [header] + lines) for index in range(len(header))]
+    output = []
+    for row in [header] + lines:
+        output.append('  '.join(
+            value.ljust(width) if index == 0 else value.rjust(width)
+            for index, (value, width) in enumerate(zip(row, widths))))
+    return '\n'.join(output)
@@ -0,0 +1,60 @@
+import click
+
+from beancount.parser import printer
+
+import beangulp
+from beangulp import cache
+from beangulp import utils
+
+from . import parallel
+from . import registry
+
+
+def iter_entries(importer, filepath):
+    # Return an iterator over the entries extracted from filepath
+    # Importers without iter_extract() fall back to their list-returning extract()
+    importer = getattr(importer, 'importer', importer)  # beangulp Adapter or LazyImporter
+    if not isinstance(importer, beangulp.Importer):
+        arg = cache.get_file(filepath)
+        if hasattr(importer, 'iter_extract'):
+            return importer.iter_extract(arg)
+        return iter(importer.extract(arg) or [])
+    if hasattr(importer, 'iter_extract'):
+        return importer.iter_extract(filepath)
+    return iter(importer.extract(filepath, []) or [])
+
+
+def write_entries(entries, output, flush_every=1000):
+    # Print entries as they are produced, only one entry is held in memory at a time
+    count = 0
+    for entry in entries:
+        output.write(printer.format_entry(entry))
+        output.write('\n')
+        count += 1
+        if count % flush_every == 0:
+            output.flush()
+    output.flush()
+    return count
+
+
+@click.command('stream')
+@click.argument('src', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Output file.')
+@click.pass_obj
+def stream_command(ctx, src, output):
+    """Extract a single large document in constant memory.
+
+    Entries are written to the output in file order as they are read,
+    without the sorting and de-duplication done by extract.
+
+    """
+    log = utils.logger(0, err=True)
+    importer = parallel.identify_file(registry.Router(ctx.importers), src)
+    if not importer:
+        raise click.ClickException('No importer identified {}'.format(src))
+
+    output.write(';; -*- mode: beancount -*-\n\n')
+    output.write('**** {}\n\n'.format(src))
+    count = write_entries(iter_entries(importer, src), output)
+    log('* {} ... {} entries'.format(src, count))
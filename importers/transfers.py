@@ -0,0 +1,147 @@
+from collections import defaultdict, deque
+from datetime import timedelta
+
+# Pair the two legs of transfers between Actual Budget accounts
+#
+# A transfer from X to Y is exported as a leg in X with payee Y and a leg of the
+# opposite amount in Y with payee X, usually on the same day but sometimes a day
+# or two apart. Legs are paired in three steps:
+#
+# 1. Legs of the same day whose accounts and payees point at each other
+# 2. Legs whose accounts and payees point at each other up to window days apart,
+#    the nearest day first
+# 3. Legs of the same day with opposite amounts, whatever their payees
+#
+# Earlier rows in the file win ties. Legs are indexed by account, payee and amount,
+# so every leg only looks at the few legs it could pair with.
+# Unpaired legs are returned on their own and get the fallback posting to their payee.
+#
+# Incremental runs read the rows after a checkpoint, see importers/checkpoints.py.
+# A leg up to window days before the file's last date may still get its partner
+# in rows appended later, so reread_from() moves the checkpoint back before those
+# days and the importer holds their unpaired legs until the next run pairs them.
+
+
+class Leg:
+    __slots__ = ('row', 'date', 'order', 'partner')
+
+    def __init__(self, row, date, order):
+        self.row = row
+        self.date = date
+        self.order = order
+        self.partner = None
+
+
+def _counterpart_key(leg):
+    row = leg.row
+    return (row.payee, row.account, -row.amount)
+
+
+def _key(leg):
+    row = leg.row
+    return (row.account, row.payee, row.amount)
+
+
+def _pair(leg, partner):
+    leg.partner = partner
+    partner.partner = leg
+
+
+def match(rows, parse_date, window=1):
+    # Return [((date, abs), [rows])] for the transfer rows, sorted like actual_rows.group_rows
+    # Each group holds a pair of legs or one unpaired leg, in file order
+    legs = [Leg(row, parse_date(row.date), order) for order, row in enumerate(rows)]
+    days = defaultdict(list)
+    for leg in legs:
+        days[leg.date].append(leg)
+
+    # Unpaired legs of earlier days for step 2, oldest first
+    earlier = defaultdict(deque)
+    for date in sorted(days):
+        today = days[date]
+
+        # 1. Same day legs that point at each other
+        waiting = defaultdict(deque)
+        for leg in today:
+            candidates = waiting.get(_counterpart_key(leg))
+            if candidates:
+                _pair(leg, candidates.popleft())
+            else:
+                waiting[_key(leg)].append(leg)
+
+        # 2. Earlier legs that point at each other within the window, nearest day first
+        for leg in today:
+            if leg.partner is not None:
+                continue
+            candidates = earlier.get(_counterpart_key(leg))
+            if not candidates:
+                continue
+            while candidates and (date - candidates[0].date).days > window:
+                candidates.popleft()
+            best = None
+            for candidate in candidates:
+                if best is None or candidate.date > best.date:
+                    best = candidate
+            if best is not None:
+                candidates.remove(best)
+                _pair(leg, best)
+
+        for leg in today:
+            if leg.partner is None:
+                earlier[_key(leg)].append(leg)
+
+    # 3. Same day legs with opposite amounts
+    for date, today in days.items():
+        waiting = defaultdict(deque)
+        for leg in today:
+            if leg.partner is not None:
+                continue
+            candidates = waiting.get(-leg.row.amount)
+            if candidates:
+                _pair(leg, candidates.popleft())
+            else:
+                waiting[leg.row.amount].append(leg)
+
+    groups = []
+    for leg in legs:
+        partner = leg.partner
+        if partner is None:
+            group = [leg]
+        elif partner.order < leg.order:
+            continue
+        else:
+            group = [leg, partner]
+        first = min(group, key=lambda member: (member.date, member.order))
+        key = (first.row.date, first.row.abs)
+        groups.append((key, first.order, [leg.row for leg in group]))
+
+    groups.sort(key=lambda group: group[:2])
+    return [(key, group) for key, order, group in groups]
+
+
+def reread_from(rows, groups, parse_date, window=1, limit=None):
+    # Return the index of the first of rows that an incremental run reads again next time
+    # That is the first row within window days of the last row's date, or limit if that is
+    # earlier, moved back so the legs of a pair in groups (as returned by match) and the
+    # rows of a day are never split
+    if not rows:
+        return 0
+    cutoff = parse_date(rows[-1].date) - timedelta(days=window)
+    index = len(rows) - 1
+    while index > 0 and parse_date(rows[index - 1].date) >= cutoff:
+        index -= 1
+    if limit is not None:
+        index = min(index, limit)
+
+    positions = {id(row): position for position, row in enumerate(rows)}
+    pairs = [sorted(positions[id(row)] for row in group) for key, group in groups if len(group) > 1]
+    moved = True
+    while moved:
+        moved = False
+        for first, last in pairs:
+            if first < index <= last:
+                index = first
+                moved = True
+        while index > 0 and rows[index - 1].date == rows[index].date:
+            index -= 1
+    return index
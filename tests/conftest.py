@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from beancount.parser import printer
+
+from benchmarks import generators
+from importers import extract_cache
+from importers import mappings
+from importers import registry
+from importers.lazy import LazyImporter
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    # Every test reads its mapping files and checkpoints from its own directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('LEDGER_DATA_DIR', str(tmp_path))
+    extract_cache.disable()
+    mappings.clear()
+    yield tmp_path
+    mappings.clear()
+
+
+@pytest.fixture
+def generate(data_dir):
+    # Write a seeded synthetic export with its mapping files, see benchmarks/generators.py
+    def generate(name, rows, seed=0):
+        return generators.generate(name, str(data_dir), rows, seed)
+    return generate
+
+
+def format_entries(entries):
+    return [printer.format_entry(entry) for entry in entries]
+
+
+def lazy_config():
+    # An import config with every importer, like import.py's CONFIG
+    return [
+        LazyImporter("importers.actual_budget.Importer", ["Assets:Bank"], signature=registry.ACTUAL_BUDGET,
+                     database=True),
+        LazyImporter("importers.ioof_super.Importer", ["Assets:Super"], signature=registry.IOOF_SUPER),
+        LazyImporter("importers.coinspot.CoinSpotImporter", signature=registry.COINSPOT),
+        LazyImporter("importers.crypto.CryptoImporter", signature=registry.CRYPTO),
+        LazyImporter("importers.custom_csv.CSVImporter", filename=r"c_.*\.csv"),
+    ]
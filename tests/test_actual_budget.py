@@ -0,0 +1,141 @@
+import csv
+import datetime
+
+from beangulp.extract import DUPLICATE
+
+from benchmarks import generators
+from importers import actual_budget
+
+import test_actual_db
+
+HEADER = ['Account', 'Date', 'Payee', 'Notes', 'Category', 'Amount', 'Cleared']
+
+
+def write(filepath, rows):
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+
+
+def importer(data_dir, monkeypatch, **kwargs):
+    generators.actual_mappings(str(data_dir))
+    monkeypatch.setattr(actual_budget, 'BEAN_DATA_DIR', str(data_dir / 'mappings'))
+    monkeypatch.setattr(actual_budget, 'CHECKPOINTS', str(data_dir / 'import_checkpoints.json'))
+    return actual_budget.Importer('Assets:Bank:Everyday', **kwargs)
+
+
+def extract(importer, filepath, ledger):
+    # Extract like beangulp does, adding the entries that aren't duplicates to the ledger
+    entries = importer.extract(filepath, ledger)
+    importer.deduplicate(entries, ledger)
+    new = [entry for entry in entries if DUPLICATE not in entry.meta]
+    ledger.extend(new)
+    return new
+
+
+def postings(entry):
+    return sorted((posting.account, posting.units.number) for posting in entry.postings)
+
+
+def test_incremental_transfer_paired_across_runs(data_dir, monkeypatch):
+    imp = importer(data_dir, monkeypatch, incremental=True)
+    filepath = str(data_dir / 'actual_export.csv')
+    rows = [
+        ['Everyday', '2022-06-01', 'Coles', '', 'Groceries', '-20.00', 'Cleared'],
+        ['Everyday', '2022-06-02', 'Woolworths', '', 'Groceries', '-30.00', 'Cleared'],
+        ['Everyday', '2022-06-03', 'Cafe', '', 'Dining', '-5.00', 'Cleared'],
+        ['Everyday', '2022-06-03', 'Savings', '', '', '-100.00', 'Cleared'],
+    ]
+    write(filepath, rows)
+    ledger = []
+    first = extract(imp, filepath, ledger)
+
+    # The leg without its partner is held back, not balanced against its payee
+    assert not [entry for entry in first if entry.narration == 'Transfer']
+    assert len(first) == 3
+
+    # The partner is appended a day later
+    rows += [
+        ['Savings', '2022-06-04', 'Everyday', '', '', '100.00', 'Cleared'],
+        ['Everyday', '2022-06-10', 'Shell', '', 'Fuel', '-60.00', 'Cleared'],
+    ]
+    write(filepath, rows)
+    second = extract(imp, filepath, ledger)
+
+    transfers = [entry for entry in ledger if entry.narration == 'Transfer']
+    assert len(transfers) == 1
+    assert postings(transfers[0]) == [
+        ('Assets:Bank:Everyday', -100), ('Assets:Bank:Savings', 100)]
+    assert [entry.payee for entry in second if entry.narration != 'Transfer'] == ['Shell']
+    assert len(ledger) == 5
+
+
+def test_incremental_keeps_pairs_together(data_dir, monkeypatch):
+    imp = importer(data_dir, monkeypatch, incremental=True)
+    filepath = str(data_dir / 'actual_export.csv')
+    rows = [
+        ['Everyday', '2022-06-01', 'Coles', '', 'Groceries', '-20.00', 'Cleared'],
+        ['Everyday', '2022-06-02', 'Savings', '', '', '-50.00', 'Cleared'],
+        ['Savings', '2022-06-03', 'Everyday', '', '', '50.00', 'Cleared'],
+        ['Everyday', '2022-06-04', 'Cafe', '', 'Dining', '-5.00', 'Cleared'],
+    ]
+    write(filepath, rows)
+    ledger = []
+    extract(imp, filepath, ledger)
+
+    rows += [['Everyday', '2022-06-20', 'Shell', '', 'Fuel', '-60.00', 'Cleared']]
+    write(filepath, rows)
+    extract(imp, filepath, ledger)
+
+    # The pair straddled the days read again, it is neither split nor repeated
+    transfers = [entry for entry in ledger if entry.narration == 'Transfer']
+    assert [postings(entry) for entry in transfers] == [
+        [('Assets:Bank:Everyday', -50), ('Assets:Bank:Savings', 50)]]
+    assert len(ledger) == 4
+
+
+def today(monkeypatch, day):
+    class Today(datetime.datetime):
+        @classmethod
+        def today(cls):
+            return cls(day.year, day.month, day.day)
+    monkeypatch.setattr(actual_budget, 'datetime', Today)
+
+
+def test_incremental_reads_future_rows_when_their_day_comes(data_dir, monkeypatch):
+    imp = importer(data_dir, monkeypatch, incremental=True)
+    filepath = str(data_dir / 'actual_export.csv')
+    write(filepath, [
+        ['Everyday', '2030-01-01', 'Coles', '', 'Groceries', '-20.00', 'Cleared'],
+        ['Everyday', '2030-01-05', 'Shell', '', 'Fuel', '-60.00', 'Cleared'],
+        ['Everyday', '2030-01-20', 'Cafe', '', 'Dining', '-5.00', 'Cleared'],
+    ])
+    ledger = []
+
+    today(monkeypatch, datetime.date(2030, 1, 2))
+    assert [entry.payee for entry in extract(imp, filepath, ledger)] == ['Coles']
+
+    # The rows after today were excluded, the checkpoint stopped before them
+    today(monkeypatch, datetime.date(2030, 1, 25))
+    assert [entry.payee for entry in extract(imp, filepath, ledger)] == ['Shell', 'Cafe']
+
+
+def test_database_incremental_reads_future_rows_when_their_day_comes(data_dir, monkeypatch):
+    imp = importer(data_dir, monkeypatch, incremental=True)
+    filepath = test_actual_db.database(data_dir)
+    ledger = []
+
+    today(monkeypatch, datetime.date(2022, 6, 15))
+    first = extract(imp, filepath, ledger)
+    assert sorted(entry.payee or entry.narration for entry in first) == ['Coles', 'Coles', 'Transfer']
+
+    # A new transaction is synced the same day, the days read again are duplicates
+    test_actual_db.add_transaction(
+        filepath, 't9', 20220610, 'p5', 'c3', -500, '2022-06-10T09:00:00.000Z-0000-a1b2c3d4e5f60718')
+    assert [entry.payee for entry in extract(imp, filepath, ledger)] == ['Cafe']
+
+    # The scheduled transaction changed before the cursor of the last run, its day has come
+    today(monkeypatch, datetime.date(2022, 6, 21))
+    assert [entry.payee for entry in extract(imp, filepath, ledger)] == ['Shell']
+    assert extract(imp, filepath, ledger) == []
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from importers import actual_budget
+from importers import actual_clean
+
+from conftest import format_entries
+
+pytest.importorskip('numpy')
+
+
+def extract(filepath, monkeypatch, min_rows):
+    monkeypatch.setattr(actual_budget, 'BEAN_DATA_DIR', os.path.join(os.path.dirname(filepath), 'mappings'))
+    monkeypatch.setattr(actual_clean, 'MIN_ROWS', min_rows)
+    return actual_budget.Importer('Assets:Bank:Everyday').extract(filepath, [])
+
+
+def test_numpy_matches_rows(generate, monkeypatch):
+    filepath = generate('actual_budget', 3000, seed=7)
+
+    calls = []
+    clean_rows = actual_clean.clean_rows
+    monkeypatch.setattr(actual_clean, 'clean_rows', lambda *args: calls.append(1) or clean_rows(*args))
+
+    rowwise = extract(filepath, monkeypatch, float('inf'))
+    assert not calls
+    columnar = extract(filepath, monkeypatch, 1)
+    assert calls
+
+    assert rowwise
+    assert format_entries(columnar) == format_entries(rowwise)
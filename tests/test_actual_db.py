@@ -0,0 +1,92 @@
+import datetime
+import os
+import shutil
+import sqlite3
+
+from importers import actual_db
+
+# Actual's tables with two accounts, a transfer between them, a split, a deleted
+# transaction and one scheduled for 2022-06-20, created in that order
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'actual.sqlite')
+
+# Timestamps of the last change before the scheduled transaction, and of the last change
+SPLIT = '2022-06-05T09:00:16.000Z-0000-a1b2c3d4e5f60718'
+LAST = '2022-06-07T09:00:18.000Z-0000-a1b2c3d4e5f60718'
+
+
+def database(data_dir):
+    filepath = str(data_dir / 'db.sqlite')
+    shutil.copyfile(FIXTURE, filepath)
+    return filepath
+
+
+def add_transaction(filepath, id, day, payee, category, cents, timestamp):
+    db = sqlite3.connect(filepath)
+    with db:
+        db.execute("""
+            INSERT INTO transactions (id, acct, category, amount, description, notes, date, sort_order)
+            VALUES (?, 'a1', ?, ?, ?, '', ?, 9)""", (id, category, cents, payee, day))
+        db.execute("""
+            INSERT INTO messages_crdt (timestamp, dataset, row, column, value)
+            VALUES (?, 'transactions', ?, 'date', '')""", (timestamp, id))
+    db.close()
+
+
+def records(rows):
+    return [(row.account, row.date, row.payee, row.notes, row.category, str(row.amount), row.cleared)
+            for row in rows]
+
+
+def test_full_read(data_dir):
+    filepath = database(data_dir)
+    assert actual_db.is_database(filepath)
+
+    rows, cursor = actual_db.read_rows(filepath)
+    # Split parents and deleted transactions are skipped, transfers are named by account
+    assert records(rows) == [
+        ('Everyday', '2022-06-20', 'Shell', 'Scheduled', 'Fuel', '-60.00', 'Cleared'),
+        ('Everyday', '2022-06-05', 'Coles', '', 'Dining', '-20.00', 'Cleared'),
+        ('Everyday', '2022-06-05', 'Coles', '', 'Groceries', '-10.00', 'Cleared'),
+        ('Savings', '2022-06-03', 'Everyday', '', '', '100.00', 'Cleared'),
+        ('Everyday', '2022-06-03', 'Savings', '', '', '-100.00', 'Cleared'),
+        ('Everyday', '2022-06-01', 'Coles', '', 'Groceries', '-20.00', 'Reconciled'),
+    ]
+    assert cursor == LAST
+
+
+def test_incremental_read(data_dir):
+    filepath = database(data_dir)
+
+    # Nothing changed since the cursor
+    assert actual_db.read_rows(filepath, since=LAST) == ([], LAST)
+
+    # Only the days of the changes after the cursor are read, with window days either side
+    add_transaction(filepath, 't9', 20220610, 'p5', 'c3', -500, '2022-06-10T09:00:00.000Z-0000-a1b2c3d4e5f60718')
+    rows, cursor = actual_db.read_rows(filepath, since=LAST)
+    assert [(row.date, row.payee) for row in rows] == [('2022-06-10', 'Cafe')]
+    assert cursor > LAST
+
+    rows, _ = actual_db.read_rows(filepath, since=LAST, window=5)
+    assert [(row.date, row.payee) for row in rows] == [('2022-06-10', 'Cafe'), ('2022-06-05', 'Coles'),
+                                                      ('2022-06-05', 'Coles')]
+
+    # A change to a payee reads everything again
+    rows, _ = actual_db.read_rows(filepath, since='2022-05-31T09:00:06.000Z-0000-a1b2c3d4e5f60718')
+    assert len(rows) == 7
+
+
+def test_cursor_stops_before_future_dated_changes(data_dir):
+    filepath = database(data_dir)
+
+    # The scheduled transaction is excluded until 2022-06-20
+    assert actual_db.read_rows(filepath, today=datetime.date(2022, 6, 15))[1] == SPLIT
+    assert actual_db.read_rows(filepath, today=datetime.date(2022, 6, 20))[1] == LAST
+
+    # Its day is read again while the cursor stays before it
+    rows, cursor = actual_db.read_rows(filepath, since=SPLIT, today=datetime.date(2022, 6, 15))
+    assert ('2022-06-20', 'Shell') in [(row.date, row.payee) for row in rows]
+    assert cursor == SPLIT
+
+    # With every transaction after today the cursor is the last change to the names before them
+    cursor = actual_db.read_rows(filepath, today=datetime.date(2022, 5, 1))[1]
+    assert cursor == '2022-05-31T09:00:10.000Z-0000-a1b2c3d4e5f60718'
@@ -0,0 +1,90 @@
+import csv
+
+import pytest
+
+from beangulp import cache
+
+from importers import chunks
+from importers import ioof_super
+from importers.coinspot import CoinSpotImporter
+from importers.crypto import CryptoImporter
+
+from conftest import format_entries
+
+ROWS = 400
+
+
+def extract(importer, filepath):
+    if isinstance(importer, ioof_super.Importer):
+        return importer.extract(filepath, [])
+    return importer.extract(cache.get_file(filepath))
+
+
+def linenos(entries):
+    return [entry.meta['lineno'] for entry in entries]
+
+
+def make_importer(name, jobs):
+    if name == 'ioof_super':
+        return ioof_super.Importer('Assets:Super', jobs=jobs)
+    if name == 'coinspot':
+        return CoinSpotImporter(jobs=jobs)
+    return CryptoImporter(jobs=jobs)
+
+
+def multiline_remarks(filepath):
+    # Give every crypto row a long quoted remark with newlines and "" escapes,
+    # so most of the split points land inside a quoted field
+    with open(filepath, newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.reader(f))
+    for index, row in enumerate(rows[1:]):
+        row[8] = 'Note {}\nmoved "from" wallet,\nsee statement {}'.format(index, 'x' * 40)
+    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+        csv.writer(f).writerows(rows)
+
+
+def inside_quotes(filepath, parts):
+    # Count the evenly spaced split targets that fall inside a quoted field
+    with open(filepath, 'rb') as f:
+        f.readline()
+        content = f.read()
+    return sum(
+        content[:len(content) * part // parts].count(b'"') % 2
+        for part in range(1, parts))
+
+
+@pytest.mark.parametrize('name', ['ioof_super', 'coinspot', 'crypto'])
+def test_chunks_match_serial(name, generate, data_dir, monkeypatch):
+    filepath = generate(name, ROWS)
+    if name == 'crypto':
+        multiline_remarks(filepath)
+        assert inside_quotes(filepath, 8)
+    monkeypatch.setattr(ioof_super, 'BEAN_DATA_DIR', str(data_dir / 'mappings'))
+    # Small ranges so a few hundred rows are split
+    monkeypatch.setattr(chunks, 'MIN_RANGE', 1024)
+    assert len(chunks.split(filepath, 8)) == 8
+
+    serial = extract(make_importer(name, 1), filepath)
+    chunked = extract(make_importer(name, 8), filepath)
+    assert len(serial) == ROWS
+    assert format_entries(chunked) == format_entries(serial)
+    assert linenos(chunked) == linenos(serial)
+
+
+def test_split_on_record_boundaries(generate, monkeypatch):
+    filepath = generate('crypto', ROWS)
+    multiline_remarks(filepath)
+    monkeypatch.setattr(chunks, 'MIN_RANGE', 1024)
+
+    with open(filepath, 'rb') as f:
+        content = f.read()
+    ranges = chunks.split(filepath, 8)
+    assert ranges[0][0] == content.index(b'\n') + 1
+    assert ranges[-1][1] == len(content)
+    rows = 0
+    for start, end in ranges:
+        # Every range parses on its own into whole records
+        records = list(csv.reader(content[start:end].decode().splitlines(keepends=True)))
+        assert all(len(record) == 11 for record in records)
+        rows += len(records)
+    assert rows == ROWS
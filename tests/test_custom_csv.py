@@ -0,0 +1,51 @@
+import csv
+
+from beancount.core import interpolate
+from beancount.core.number import D
+from beangulp import cache
+
+from importers.custom_csv import CSVImporter
+
+HEADER = ['Date', 'Flag', 'Payee', 'Description', 'Tags',
+          'Account1', 'Amount1', 'Account2', 'Amount2', 'Account3', 'Amount3', 'Account4', 'Amount4']
+
+
+def extract(data_dir, rows):
+    path = data_dir / 'c_test.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return CSVImporter().extract(cache.get_file(str(path)))
+
+
+def legs(entry):
+    return [(posting.account, posting.units.number) for posting in entry.postings]
+
+
+def test_blank_legs_split_the_balance_pro_rata(data_dir):
+    entries = extract(data_dir, [
+        ['1/7/2021', '', 'Shop', 'Three ways', '', 'Assets:Bank', '-100.00',
+         'Expenses:Food', '', 'Expenses:Home', '', 'Expenses:Gifts', ''],
+        ['2/7/2021', '', 'Shop', 'Two ways', '', 'Assets:Bank', '-10.01',
+         'Expenses:Food', '', 'Expenses:Home', '', '', ''],
+    ])
+
+    # The last blank leg takes the rounding remainder
+    assert legs(entries[0]) == [
+        ('Assets:Bank', D('-100.00')), ('Expenses:Food', D('33.33')),
+        ('Expenses:Home', D('33.33')), ('Expenses:Gifts', D('33.34'))]
+    assert legs(entries[1]) == [
+        ('Assets:Bank', D('-10.01')), ('Expenses:Food', D('5.00')), ('Expenses:Home', D('5.01'))]
+    for entry in entries:
+        assert interpolate.compute_residual(entry.postings).is_empty()
+
+
+def test_blank_legs_without_amounts(data_dir):
+    entry, = extract(data_dir, [
+        ['1/7/2021', '', 'Shop', 'Nothing to balance', '', 'Assets:Bank', '',
+         'Expenses:Food', '', '', '', '', ''],
+    ])
+
+    assert legs(entry) == [('Assets:Bank', D('0')), ('Expenses:Food', D('0'))]
+    assert interpolate.compute_residual(entry.postings).is_empty()
@@ -0,0 +1,54 @@
+import datetime
+
+import pytest
+from beancount.ingest import cache
+
+from importers.custom_csv import CSVImporter
+from importers.dates import DateParser
+
+DAY_FIRST = ('%d/%m/%Y', '%Y-%m-%d')
+MONTH_FIRST = ('%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y')
+
+
+def test_detect_moves_the_best_format_first():
+    parse_date = DateParser(MONTH_FIRST)
+    assert parse_date.detect(['2021-07-01', '', '2021-12-15']) == '%Y-%m-%d'
+    assert parse_date('2021-07-01') == datetime.date(2021, 7, 1)
+
+
+def test_ambiguous_first_sample_is_settled_by_later_values():
+    # The first dates read either way, 15/12/2021 is only valid day first
+    parse_date = DateParser(MONTH_FIRST)
+    assert parse_date.detect(['01/02/2021', '03/04/2021', '15/12/2021']) == '%d/%m/%Y'
+    assert parse_date('01/02/2021') == datetime.date(2021, 2, 1)
+
+
+def test_all_ambiguous_keeps_the_given_order():
+    parse_date = DateParser(MONTH_FIRST)
+    assert parse_date.detect(['01/02/2021', '03/04/2021']) == '%m/%d/%Y'
+    assert parse_date('01/02/2021') == datetime.date(2021, 1, 2)
+    # Values the detected format rejects still try the others
+    assert parse_date('15/12/2021') == datetime.date(2021, 12, 15)
+
+
+def test_fallback():
+    parse_date = DateParser(DAY_FIRST, fallback=lambda text: datetime.date(2000, 1, 1))
+    assert parse_date('March 3 2021') == datetime.date(2000, 1, 1)
+    with pytest.raises(ValueError):
+        DateParser(DAY_FIRST)('March 3 2021')
+
+
+def extract_dates(data_dir, dates):
+    path = data_dir / 'c_dates.csv'
+    lines = ['Date,Flag,Payee,Description,Tags,Account1,Amount1,Account2,Amount2']
+    lines += ['{},,Payee,Description,,Assets:Cash,10,Expenses:Misc,'.format(text) for text in dates]
+    path.write_text('\n'.join(lines) + '\n')
+    return [entry.date for entry in CSVImporter().extract(cache.get_file(str(path)))]
+
+
+def test_custom_csv_reads_a_file_day_first_or_month_first(data_dir):
+    # Ambiguous dates are read month first like dateutil did
+    assert extract_dates(data_dir, ['1/7/2021']) == [datetime.date(2021, 1, 7)]
+    # but a file with day first dates is now read day first throughout, not row by row
+    assert extract_dates(data_dir, ['1/7/2021', '15/12/2021']) == [
+        datetime.date(2021, 7, 1), datetime.date(2021, 12, 15)]
@@ -0,0 +1,91 @@
+import beangulp
+from beancount import loader
+from beangulp.extract import DUPLICATE
+
+from importers import dedup
+
+EXISTING = """
+2021-01-01 open Assets:Bank
+2021-01-01 open Expenses:Food
+2021-01-01 open Expenses:Fuel
+
+2021-03-01 * "Coles" ""
+  Assets:Bank  -45.10 AUD
+  Expenses:Food
+
+2021-03-02 * "Shell" ""
+  Assets:Bank  -60.00 AUD
+  Expenses:Fuel
+
+2021-03-05 * "Cafe" ""
+  Assets:Bank  -4.50 AUD
+  Expenses:Food
+"""
+
+EXTRACTED = """
+2021-01-01 open Assets:Bank
+2021-01-01 open Expenses:Food
+2021-01-01 open Expenses:Fuel
+2021-01-01 open Income:Salary
+
+; The same transactions imported again, payee case and spacing differ
+2021-03-01 * "COLES  " ""
+  Assets:Bank  -45.10 AUD
+  Expenses:Food
+
+2021-03-05 * "Cafe" ""
+  Assets:Bank  -4.50 AUD
+  Expenses:Food
+
+; New on the same days: other amounts or other accounts
+2021-03-01 * "Coles" ""
+  Assets:Bank  -90.00 AUD
+  Expenses:Food
+
+2021-03-02 * "Employer" ""
+  Assets:Bank  2000.00 AUD
+  Income:Salary
+
+2021-04-01 * "Shell" ""
+  Assets:Bank  -60.00 AUD
+  Expenses:Fuel
+"""
+
+
+class Default(beangulp.Importer):
+    # beangulp's own deduplicate(), with its default cmp()
+    def identify(self, filepath):
+        return False
+
+    def account(self, filepath):
+        return 'Assets:Bank'
+
+
+def marked(mark):
+    existing, errors, _ = loader.load_string(EXISTING)
+    assert not errors
+    # Not in date order, as beangulp leaves the list after earlier files
+    existing.reverse()
+    entries, errors, _ = loader.load_string(EXTRACTED)
+    assert not errors
+    entries = [entry for entry in entries if hasattr(entry, 'postings')]
+    mark(entries, existing)
+    return [(entry.date, entry.payee, entry.meta.get(DUPLICATE) is not None) for entry in entries]
+
+
+def test_mark_duplicates_matches_beangulp():
+    ours = marked(dedup.mark_duplicates)
+    assert ours == marked(Default().deduplicate)
+    assert sorted(payee for date, payee, duplicate in ours if duplicate) == ['COLES  ', 'Cafe']
+
+
+def test_index_keeps_no_state_between_calls():
+    # A second call with a list reordered in place sees every entry again
+    existing, _, _ = loader.load_string(EXISTING)
+    entries, _, _ = loader.load_string(EXTRACTED)
+    entries = [entry for entry in entries if hasattr(entry, 'postings')]
+    coles, cafe = [entry for entry in entries if entry.payee in ('COLES  ', 'Cafe')]
+    dedup.mark_duplicates([coles], existing)
+    existing.sort(key=lambda entry: entry.date, reverse=True)
+    dedup.mark_duplicates([cafe], existing)
+    assert DUPLICATE in coles.meta and DUPLICATE in cafe.meta
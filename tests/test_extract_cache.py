@@ -0,0 +1,172 @@
+import datetime
+import os
+
+import pytest
+
+from benchmarks import generators
+from importers import actual_budget
+from importers import extract_cache
+from importers import ioof_super
+
+from conftest import format_entries
+
+MAP_FILE = 'test_mappings.csv'
+MAP_DIR = '/nonexistent'
+
+# Files extracted by the test importers, to tell hits from misses
+calls = []
+
+
+class Importer:
+    def __init__(self, account, incremental=False):
+        self.account = account
+        self.incremental = incremental
+
+    @extract_cache.cached(lambda self: [(MAP_FILE, MAP_DIR)], skip=lambda self: self.incremental)
+    def extract(self, filepath):
+        calls.append(filepath)
+        with open(filepath) as f:
+            return [self.account, f.read()]
+
+
+class DailyImporter(Importer):
+    @extract_cache.cached(daily=True)
+    def extract(self, filepath):
+        calls.append(filepath)
+        return [datetime.date.today().isoformat()]
+
+
+@pytest.fixture
+def cache(data_dir, monkeypatch):
+    # An enabled cache and a mapping directory set after the importers were defined
+    monkeypatch.setattr(extract_cache, '_path', str(data_dir / 'cache.sqlite'))
+    monkeypatch.setitem(globals(), 'MAP_DIR', str(data_dir / 'mappings'))
+    os.mkdir(data_dir / 'mappings')
+    write(data_dir / 'mappings' / MAP_FILE, 'a,b\n')
+    del calls[:]
+    yield data_dir
+    del calls[:]
+
+
+def write(path, text):
+    # Bump the mtime as well, the file hashes are reused while it and the size are unchanged
+    with open(path, 'w') as f:
+        f.write(text)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_unchanged_file_hits(cache):
+    filepath = str(cache / 'export.csv')
+    write(filepath, 'Date,Amount\n')
+    importer = Importer('Assets:Bank')
+
+    first = importer.extract(filepath)
+    assert importer.extract(filepath) == first
+    assert Importer('Assets:Bank').extract(filepath) == first
+    assert calls == [filepath]
+
+
+def test_changed_file_misses(cache):
+    filepath = str(cache / 'export.csv')
+    write(filepath, 'Date,Amount\n')
+    importer = Importer('Assets:Bank')
+    importer.extract(filepath)
+
+    write(filepath, 'Date,Amount\n2021-07-01,1.00\n')
+    assert importer.extract(filepath) == ['Assets:Bank', 'Date,Amount\n2021-07-01,1.00\n']
+    assert len(calls) == 2
+
+
+def test_changed_mapping_file_misses(cache):
+    filepath = str(cache / 'export.csv')
+    write(filepath, 'Date,Amount\n')
+    importer = Importer('Assets:Bank')
+    importer.extract(filepath)
+
+    write(cache / 'mappings' / MAP_FILE, 'a,c\n')
+    importer.extract(filepath)
+    importer.extract(filepath)
+    assert len(calls) == 2
+
+
+def test_mapping_directory_is_read_when_extracting(cache, monkeypatch):
+    # ioof_super.BEAN_DATA_DIR is patched after its extract was decorated
+    generators.ioof_mappings(str(cache))
+    monkeypatch.setattr(ioof_super, 'BEAN_DATA_DIR', str(cache / 'mappings'))
+    filepath = generators.ioof(str(cache / 'ioof.csv'), 50)
+    importer = ioof_super.Importer('Assets:Super')
+    first = format_entries(importer.extract(filepath, []))
+
+    map_file = cache / 'mappings' / ioof_super.MAP_FILE
+    with open(map_file) as f:
+        text = f.read()
+    write(map_file, text.replace('Assets:Super', 'Assets:Pension'))
+    second = format_entries(importer.extract(filepath, []))
+    assert not any('Assets:Pension' in entry for entry in first)
+    assert any('Assets:Pension' in entry for entry in second)
+
+
+def test_daily_entries_expire(cache, monkeypatch):
+    filepath = str(cache / 'export.csv')
+    write(filepath, 'Date,Amount\n')
+    importer = DailyImporter('Assets:Bank')
+
+    assert importer.extract(filepath) == importer.extract(filepath)
+    assert len(calls) == 1
+
+    class Tomorrow(datetime.date):
+        @classmethod
+        def today(cls):
+            today = datetime.date.today()
+            return cls(today.year, today.month, today.day) + datetime.timedelta(days=1)
+    monkeypatch.setattr(extract_cache, 'date', Tomorrow)
+    importer.extract(filepath)
+    assert len(calls) == 2
+
+
+def test_skip_is_never_cached(cache):
+    filepath = str(cache / 'export.csv')
+    write(filepath, 'Date,Amount\n')
+    importer = Importer('Assets:Bank', incremental=True)
+
+    importer.extract(filepath)
+    importer.extract(filepath)
+    assert len(calls) == 2
+    # Nor saved for the importer that is cached
+    Importer('Assets:Bank').extract(filepath)
+    assert len(calls) == 3
+
+
+def test_importers_of_the_same_file_keep_their_entries(cache):
+    filepath = str(cache / 'export.csv')
+    write(filepath, 'Date,Amount\n')
+    bank = Importer('Assets:Bank')
+    card = Importer('Liabilities:Card')
+
+    for _ in range(3):
+        assert bank.extract(filepath)[0] == 'Assets:Bank'
+        assert card.extract(filepath)[0] == 'Liabilities:Card'
+    assert len(calls) == 2
+
+    # The importers of both modules are called Importer
+    assert (extract_cache.importer_name(actual_budget.Importer('Assets:Bank'))
+            != extract_cache.importer_name(ioof_super.Importer('Assets:Bank')))
+
+
+def test_connection_closed_when_the_key_fails(cache, monkeypatch):
+    closed = []
+
+    class Failing(extract_cache.Cache):
+        def key(self, *args):
+            raise OSError('unreadable')
+
+        def close(self):
+            closed.append(self.path)
+            super().close()
+    monkeypatch.setattr(extract_cache, 'Cache', Failing)
+
+    filepath = str(cache / 'export.csv')
+    write(filepath, 'Date,Amount\n')
+    assert Importer('Assets:Bank').extract(filepath) == ['Assets:Bank', 'Date,Amount\n']
+    assert closed == [extract_cache.cache_path()]
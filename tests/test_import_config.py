@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that loading import.py's CONFIG must not import, fava reloads it often
+DEFERRED = (
+    'importers.actual_budget', 'importers.actual_db', 'importers.ioof_super',
+    'importers.parallel', 'importers.streaming', 'importers.chunks',
+    'multiprocessing', 'concurrent.futures', 'sqlite3', 'urllib.request',
+)
+
+SCRIPT = """
+import runpy, sys
+config = runpy.run_path('import.py')['CONFIG']
+print(len(config))
+print('\\n'.join(sorted(sys.modules)))
+"""
+
+
+def test_loading_the_config_imports_no_importer_modules():
+    # A fresh interpreter, the test session has imported everything already
+    output = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout.split()
+    count, modules = int(output[0]), set(output[1:])
+    assert count == 2
+    assert {'importers.lazy', 'importers.registry'} <= modules
+    assert not modules.intersection(DEFERRED)
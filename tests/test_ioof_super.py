@@ -0,0 +1,64 @@
+import csv
+
+import pytest
+
+from beancount import loader
+from beancount.core.number import D
+from beancount.parser import printer
+
+from benchmarks import generators
+from importers import ioof_super
+
+HEADER = ['Date', 'Type', 'Description', 'Unit price', 'Units', 'Amount']
+
+OPEN = """
+2020-01-01 open Assets:Super:Cash
+2020-01-01 open Assets:Super:IOOFBAL
+2020-01-01 open Income:Super:Gains
+"""
+
+
+def extract(data_dir, monkeypatch, rows, **kwargs):
+    generators.ioof_mappings(str(data_dir))
+    monkeypatch.setattr(ioof_super, 'BEAN_DATA_DIR', str(data_dir / 'mappings'))
+    filepath = str(data_dir / 'ioof.csv')
+    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return ioof_super.Importer('Assets:Super', **kwargs).extract(filepath, [])
+
+
+def asset(entry):
+    posting, = [posting for posting in entry.postings if posting.account == 'Assets:Super:IOOFBAL']
+    return posting
+
+
+def test_aggregate_balances(data_dir, monkeypatch):
+    entries = extract(data_dir, monkeypatch, [
+        ['01/07/2021', 'Buys', 'IOOF Balanced', '1.2345', '100.0000', '123.45'],
+        ['01/07/2021', 'Buys', 'IOOF Balanced', '1.2351', '50.0000', '61.76'],
+        ['02/07/2021', 'Sells', 'IOOF Balanced', '2.5000', '-100.0000', '-250.00'],
+        ['02/07/2021', 'Sells', 'IOOF Balanced', '2.6000', '-30.0000', '-78.00'],
+    ], aggregate=True)
+    buy, sell = entries
+
+    # Buys are held at the cash paid per unit
+    assert buy.meta['legs'] == 2
+    assert asset(buy).units.number == D('150')
+    assert asset(buy).cost.number == (D('185.21') / 150).quantize(ioof_super.AGGREGATE_QUANTUM)
+
+    # Sells keep the unit prices weighted by units
+    assert sell.meta['legs'] == 2
+    assert asset(sell).units.number == D('-130')
+    weighted = (100 * D('2.5') + 30 * D('2.6')) / 130
+    assert asset(sell).price.number == weighted.quantize(ioof_super.AGGREGATE_QUANTUM)
+
+    # Both balance when booked
+    _, errors, _ = loader.load_string(OPEN + '\n'.join(printer.format_entry(entry) for entry in entries))
+    assert not errors
+
+
+def test_aggregate_rejects_incremental():
+    with pytest.raises(ValueError):
+        ioof_super.Importer('Assets:Super', incremental=True, aggregate=True)
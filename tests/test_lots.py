@@ -0,0 +1,79 @@
+import datetime
+
+from beancount import loader
+from beancount.core import data
+from beancount.core import interpolate
+from beancount.core.amount import Amount
+from beancount.core.number import D
+from beancount.core.position import Cost
+from beancount.parser import printer
+
+from importers import lots
+from importers.coinspot import ASSET_ACCOUNT, GAINS_ACCOUNT
+
+LEDGER = """
+option "operating_currency" "AUD"
+2020-01-01 open Assets:Crypto:CoinSpot:BTC
+2020-01-01 open Assets:Crypto:CoinSpot:Cash
+2020-01-01 open Income:Crypto:Gains
+
+2020-01-01 * "Buy"
+  Assets:Crypto:CoinSpot:BTC  1 BTC {100 AUD}
+  Assets:Crypto:CoinSpot:Cash
+
+2020-02-01 * "Buy"
+  Assets:Crypto:CoinSpot:BTC  1 BTC {200 AUD}
+  Assets:Crypto:CoinSpot:Cash
+
+2020-03-01 * "Sell the newer lot"
+  Assets:Crypto:CoinSpot:BTC  -1 BTC {200 AUD, 2020-02-01} @ 250 AUD
+  Assets:Crypto:CoinSpot:Cash  250 AUD
+  Income:Crypto:Gains
+"""
+
+
+def sell(date, units, price):
+    # A sell as CoinSpotImporter extracts it, with the lot left for booking
+    return data.Transaction(
+        data.new_metadata('coinspot.csv', 2), date, '*', None, 'Sell', set(), set(), [
+            data.Posting(ASSET_ACCOUNT + 'BTC', Amount(-units, 'BTC'), Cost(None, 'AUD', None, None),
+                         Amount(price, 'AUD'), None, None),
+            data.Posting(ASSET_ACCOUNT + 'Cash', Amount(units * price, 'AUD'), None, None, None, None),
+            data.Posting(GAINS_ACCOUNT, None, None, None, None, None),
+        ])
+
+
+def test_ledger_sells_reduce_the_booked_lot():
+    existing, errors, _ = loader.load_string(LEDGER)
+    assert not errors
+
+    entry, = lots.book([sell(datetime.date(2020, 4, 1), D('1'), D('300'))],
+                       ASSET_ACCOUNT, GAINS_ACCOUNT, existing)
+
+    # The ledger sold the 2020-02-01 lot, so only the 2020-01-01 lot is left
+    held = [posting for posting in entry.postings if posting.cost is not None]
+    assert [(posting.units.number, posting.cost.number, posting.cost.date) for posting in held] == [
+        (D('-1'), D('100'), datetime.date(2020, 1, 1))]
+    assert interpolate.compute_residual(entry.postings).is_empty()
+
+    # And the ledger books it without errors
+    _, errors, _ = loader.load_string(LEDGER + printer.format_entry(entry))
+    assert not errors
+
+
+def test_reduce_lot_keeps_the_rest_in_date_order():
+    index = lots.LotIndex()
+    for day, cost in [(3, 300), (1, 100), (2, 200), (4, 200)]:
+        index.add('BTC', datetime.date(2020, 1, day), D('2'), D(cost))
+
+    # Half the oldest 200 AUD lot, the lots passed over stay open
+    index.reduce_lot('BTC', D('1'), D('200'))
+    assert index.available('BTC') == D('7')
+
+    assert index.reduce('BTC', D('7')) == [
+        (D('2'), D('100'), datetime.date(2020, 1, 1)),
+        (D('1'), D('200'), datetime.date(2020, 1, 2)),
+        (D('2'), D('300'), datetime.date(2020, 1, 3)),
+        (D('2'), D('200'), datetime.date(2020, 1, 4)),
+    ]
+    assert not index.lots['BTC']
@@ -0,0 +1,39 @@
+import os
+
+import beangulp
+from click.testing import CliRunner
+
+from benchmarks import generators
+from importers import actual_budget
+from importers import ioof_super
+from importers import parallel
+
+from conftest import lazy_config
+
+
+def extract(src, jobs):
+    ingest = beangulp.Ingest(lazy_config())
+    ingest.cli.add_command(parallel.extract_command)
+    result = CliRunner().invoke(ingest.cli, ['extract', src, '-j', str(jobs)], catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_jobs_match_serial(data_dir, monkeypatch):
+    src = data_dir / 'import_files'
+    src.mkdir()
+    # Two files of every format, each with its own seed so no two end on the same date
+    # (beangulp can't sort files of legacy importers against others that end the same day)
+    for number, (filename, generator, write_mappings) in enumerate(generators.FORMATS.values()):
+        if write_mappings is not None:
+            write_mappings(str(data_dir))
+        for seed in (number, number + 10):
+            stem, ext = os.path.splitext(filename)
+            generator(str(src / '{}_{}{}'.format(stem, seed, ext)), 60, seed)
+    (src / 'statement.pdf').write_bytes(b'%PDF-1.4\n')
+    monkeypatch.setattr(actual_budget, 'BEAN_DATA_DIR', str(data_dir / 'mappings'))
+    monkeypatch.setattr(ioof_super, 'BEAN_DATA_DIR', str(data_dir / 'mappings'))
+
+    serial = extract(str(src), 1)
+    assert serial.count('**** ') == len(os.listdir(src)) - 1
+    assert extract(str(src), 3) == serial
@@ -0,0 +1,74 @@
+import beangulp
+from beangulp import cache
+
+from importers import registry
+
+from benchmarks import generators
+
+from conftest import lazy_config
+
+
+def files(data_dir):
+    paths = [generators.generate(name, str(data_dir), 20) for name in generators.FORMATS]
+    for name, content in (('statement.pdf', b'%PDF-1.4\n'), ('empty.csv', b''), ('notes.txt', b'hello\n')):
+        path = data_dir / name
+        path.write_bytes(content)
+        paths.append(str(path))
+    return paths
+
+
+def test_router_matches_identify(data_dir):
+    importers = lazy_config()
+    router = registry.Router(importers)
+    for path in files(data_dir):
+        assert router.identify(path) == [importer for importer in importers if importer.identify(path)]
+
+    # Only custom_csv is asked for every file, the rest are routed by a lookup per distinct header
+    assert [importer.path for importer in router.fallback] == ["importers.custom_csv.CSVImporter"]
+    assert len(router._routes) == 6  # the five exports and notes.txt
+
+
+def test_prefilter_rejects_binary_empty_and_wrong_extension(data_dir):
+    header = ','.join(registry.IOOF_SUPER.columns).encode() + b'\n'
+    rejected = {
+        # Binary magic, whatever the extension and with bytes that aren't UTF-8
+        'archive.csv': b'PK\x03\x04' + header + b'\xff\xfe' * 100,
+        'compressed.csv': b'\x1f\x8b\x08' + header,
+        'image.csv': b'\x89PNG\r\n\x1a\n' + header,
+        'budget.csv': b'SQLite format 3\0' + header,
+        # Empty
+        'empty.csv': b'',
+        # A valid header behind a binary extension
+        'export.pdf': header,
+        'export.xlsx': header,
+        # NUL bytes in the header line, and no line break in the first PREFIX_SIZE bytes
+        'utf16.csv': header.decode().encode('utf-16-le'),
+        'long.csv': b'x' * (registry.PREFIX_SIZE + 1),
+    }
+    paths = []
+    for name, content in rejected.items():
+        path = data_dir / name
+        path.write_bytes(content)
+        paths.append(str(path))
+
+    importers = [importer for importer in lazy_config() if importer.header_signature is not None]
+    for path in paths:
+        assert registry.read_header(path) is None
+        for signature in (registry.ACTUAL_BUDGET, registry.IOOF_SUPER, registry.COINSPOT, registry.CRYPTO):
+            assert not registry.matches(signature, path)
+        assert [importer for importer in importers if importer.identify(path)] == []
+    # Nothing was imported to reject them
+    assert not any(importer.loaded for importer in importers)
+
+    # Nor do the importers' own identify() accept them or raise
+    for path in paths:
+        for importer in importers:
+            if isinstance(importer.importer, beangulp.Importer):
+                assert not importer.importer.identify(path)
+            else:
+                assert not importer.importer.identify(cache.get_file(path))
+
+    # The same header in a .csv file is accepted
+    path = data_dir / 'export.csv'
+    path.write_bytes(header)
+    assert registry.matches(registry.IOOF_SUPER, str(path))